@@ -0,0 +1,82 @@
+"""
+Synthetic templates for the benchmarks.
+
+The templates are built deterministically from a seed, so the same case
+always measures the same input.
+"""
+import random
+
+
+def expression(rng, width, symbols):
+    """
+    Returns an expression of `width` identifiers taken from the `symbols`
+    names, joined by and/or, with some negated and some parenthesized.
+    """
+    terms = []
+    for i in range(width):
+        term = rng.choice(symbols)
+        if rng.random() < 0.25:
+            term = 'not ' + term
+
+        terms.append(term)
+
+    result = terms[0]
+    for term in terms[1:]:
+        operator = ' and ' if rng.random() < 0.5 else ' or '
+        if rng.random() < 0.2:
+            result = '(' + result + ')'
+
+        result += operator + term
+
+    return result
+
+
+def template(lines=1000, depth=1, elifs=1, width=2, symbols=8, text_lines=3, seed=0):
+    """
+    Returns the text of a template with about `lines` lines, made of if
+    blocks nested `depth` levels deep in their #if branch, each with `elifs`
+    #elif entries and an #else, whose expressions have `width` identifiers
+    out of `symbols`.
+    """
+    rng = random.Random(seed)
+    names = ['s%d' % i for i in range(symbols)]
+    result = []
+
+    def text():
+        for i in range(text_lines):
+            result.append('select %d from t%d where x = %d' % (len(result), rng.randrange(100), rng.randrange(1000)))
+
+    def block(level):
+        # only the #if branch nests, so the size grows linearly with depth
+        result.append('#if ' + expression(rng, width, names))
+        body(level, level < depth)
+        for i in range(elifs):
+            result.append('#elif ' + expression(rng, width, names))
+            body(level, False)
+
+        result.append('#else')
+        body(level, False)
+        result.append('#endif')
+
+    def body(level, nested):
+        text()
+        if nested:
+            block(level + 1)
+            text()
+
+    while len(result) < lines:
+        text()
+        block(1)
+
+    return '\n'.join(result)
+
+
+def symbol_sets(count=100, symbols=8, density=0.5, seed=0):
+    """
+    Returns `count` random sets of the `symbols` names, each name present
+    with probability `density`, plus some names no template references.
+    """
+    rng = random.Random(seed)
+    names = ['s%d' % i for i in range(symbols)]
+    unrelated = ['u%d' % i for i in range(4)]
+    return [{name for name in names if rng.random() < density} | set(unrelated) for i in range(count)]
@@ -0,0 +1,210 @@
+"""
+Benchmarks of the ppdpy hot paths: lexing and parsing expressions,
+compiling templates and rendering them, over synthetic templates that vary
+in size, nesting depth, #elif chain length, expression width and number of
+symbols.
+
+    $ python benchmarks/run.py                          # run all the cases
+    $ python benchmarks/run.py --save baseline.json     # record a baseline
+    $ python benchmarks/run.py --baseline baseline.json # compare against it
+
+Each stage is timed separately, keeping the best of several repeats, and the
+peak memory allocated while compiling and rendering is measured with
+tracemalloc. Every compile starts from scratch, as nothing is shared between
+templates, and the first render of a new template, which generates its
+expression tests, is timed apart from the later ones. When comparing against a baseline, the command exits with
+status 1 if any timing is slower than the baseline by more than the given
+tolerance.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ppdpy
+from ppdpy.expression_compiler import lex, parse
+from ppdpy.template_compiler import compile as compile_template, LINEBREAK
+
+from generators import template, symbol_sets
+
+# name: (template parameters, number of symbols rendered with)
+CASES = {
+    'small': (dict(lines=100), 8),
+    'lines': (dict(lines=100000), 8),
+    'depth': (dict(lines=20000, depth=16), 8),
+    'elifs': (dict(lines=20000, elifs=32), 8),
+    'width': (dict(lines=20000, width=32), 8),
+    'symbols': (dict(lines=20000, width=8, symbols=256), 256),
+}
+
+STAGES = ['lex', 'parse', 'compile', 'first_render', 'render']
+
+
+def best_time(function, repeat, number=1):
+    """
+    Returns the best time of `repeat` runs of `number` calls to `function`,
+    in seconds per call.
+    """
+    best = None
+    gc.collect()
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+
+        elapsed = (time.perf_counter() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def first_render(compile, symbols, repeat):
+    """
+    Returns the best time of `repeat` first renders of templates returned by
+    `compile`, in seconds.
+    """
+    best = None
+    for i in range(repeat):
+        template = compile()
+        gc.collect()
+        start = time.perf_counter()
+        template.render(symbols)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def peak_memory(function):
+    """
+    Returns the peak memory allocated while calling `function`, in bytes.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+
+def expressions(text):
+    prefix = '#if ', '#elif '
+    return [line.split(' ', 1)[1] for line in text.split(LINEBREAK) if line.startswith(prefix)]
+
+
+def run_case(parameters, symbols, mode, repeat):
+    text = template(**parameters)
+    lines = text.split(LINEBREAK)
+    sources = expressions(text)
+    tokens = [list(lex(source)) for source in sources]
+    inputs = symbol_sets(symbols=symbols)
+    compiled = ppdpy.compiles(text, mode=mode)
+
+    def render():
+        for symbols in inputs:
+            compiled.render(symbols)
+
+    return {
+        'lines': len(lines),
+        'expressions': len(sources),
+        'lex': best_time(lambda: [list(lex(source)) for source in sources], repeat),
+        'parse': best_time(lambda: [parse(t) for t in tokens], repeat),
+        'compile': best_time(lambda: ppdpy.compiles(text, mode=mode), repeat),
+        'first_render': first_render(lambda: ppdpy.compiles(text, mode=mode), inputs[0], repeat),
+        'render': best_time(render, repeat) / len(inputs),
+        'compile_peak': peak_memory(lambda: compile_template(lines)),
+        'render_peak': peak_memory(lambda: compiled.render(inputs[0])),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of each timing against the baseline, and returns the
+    list of the ones slower than `tolerance` allows.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+
+        for stage in STAGES:
+            before, after = previous.get(stage), result[stage]
+            if not before:
+                continue
+
+            ratio = after / before
+            flag = ''
+            if ratio > 1 + tolerance:
+                flag = '  <- slower'
+                regressions.append((name, stage, ratio))
+
+            print('%-10s %-12s %10.3f ms -> %10.3f ms  %+6.1f%%%s' % (
+                name, stage, before * 1000, after * 1000, (ratio - 1) * 100, flag))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks ppdpy on synthetic templates.')
+    parser.add_argument('cases', nargs='*', help='cases to run (default: all of %s)' % ', '.join(CASES))
+    parser.add_argument('--mode', default='tree', help='compile mode of the templates (default: tree)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each timing, keeping the best (default: 5)')
+    parser.add_argument('--save', metavar='FILE', help='write the results to a baseline file')
+    parser.add_argument('--baseline', metavar='FILE', help='compare the results with a baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown against the baseline reported as a regression (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    names = args.cases or list(CASES)
+    for name in names:
+        if name not in CASES:
+            parser.error('unknown case ' + name)
+
+    results = {}
+    for name in names:
+        parameters, symbols = CASES[name]
+        result = results[name] = run_case(parameters, symbols, args.mode, args.repeat)
+        print('%-10s %7d lines  lex %9.3f ms  parse %9.3f ms  compile %9.3f ms  first %9.3f ms  '
+              'render %9.3f ms  peak %8.1f KiB / %8.1f KiB' % (
+                  name, result['lines'], result['lex'] * 1000, result['parse'] * 1000,
+                  result['compile'] * 1000, result['first_render'] * 1000, result['render'] * 1000,
+                  result['compile_peak'] / 1024, result['render_peak'] / 1024))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'ppdpy': ppdpy.__version__,
+                'python': platform.python_version(),
+                'mode': args.mode,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if baseline.get('mode', 'tree') != args.mode:
+            print('warning: the baseline was recorded in %s mode' % baseline.get('mode'), file=sys.stderr)
+
+        print()
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print('%d timings slower than the baseline' % len(regressions), file=sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
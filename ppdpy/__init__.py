@@ -1,34 +1,202 @@
-from ppdpy.template_compiler import compile as compile_template, LINEBREAK
+from time import perf_counter
+
+from ppdpy.constraints import Constraints
+from ppdpy.dialect import Dialect
+from ppdpy.template_compiler import compile as compile_template, preprocess, LINEBREAK
+from ppdpy.version import __version__
+
+
+_compile_cache = None
+_instrumentation = None
 
 
 def render(file, symbols):
-    template = compile(file)
+    cache = _compile_cache
+    template = _compile_source(file) if cache is None else cache.compile_file(file)
     return template.render(symbols)
 
 
 def renders(text, symbols):
-    template = compiles(text)
+    cache = _compile_cache
+    template = _compile_source(text) if cache is None else cache.compile_text(text)
     return template.render(symbols)
 
 
-def compile(file):
-    return compile_template(file)
+def _compile_source(source, dialect=None):
+    """
+    Compiles the text or file given to `render` or `renders`. The statistics
+    of the templates compiled from the same text or file name are recorded
+    together, whether they are cached or compiled on every call.
+    """
+    started = perf_counter()
+    if isinstance(source, str):
+        template = compile_template(source.split(LINEBREAK), dialect)
+        name = None
+        key = ('text', source)
 
+    else:
+        template = compile_template(source, dialect)
+        name = getattr(source, 'name', None)
+        name = name if isinstance(name, str) else None
+        key = None if name is None else ('file', name)
 
-def compiles(text):
-    return compile_template(text.split(LINEBREAK))
+    return _finish(template, MODE_TREE, None, False, False, None, name, started, key)
 
 
-def set_directive_prefix(prefix):
-    import ppdpy.template_compiler
-    import string
+def enable_compile_cache(maxsize=128):
+    """
+    Makes `render` and `renders` reuse up to `maxsize` compiled templates.
+    """
+    global _compile_cache
+    from ppdpy.cache import CompileCache
+    _compile_cache = CompileCache(maxsize, _compile_source)
+
+
+def disable_compile_cache():
+    global _compile_cache
+    _compile_cache = None
+
+
+def compile_cache_info():
+    """
+    Returns the compile cache statistics, or None when it is disabled.
+    """
+    cache = _compile_cache
+    return None if cache is None else cache.info()
+
+
+def enable_instrumentation(callback=None):
+    """
+    Records the compile time, renders and branches taken of the templates
+    compiled from now on, including the ones compiled by `render` and
+    `renders`, which are recorded by text or file name. The `callback`, when
+    given, is called with the event ('compile' or 'render'), the template and
+    the duration in seconds.
+    """
+    global _instrumentation
+    from ppdpy.instrumentation import Instrumentation
+    _instrumentation = Instrumentation(callback)
+
+
+def disable_instrumentation():
+    """
+    Stops instrumenting new templates. Templates already instrumented keep
+    recording into the discarded statistics.
+    """
+    global _instrumentation
+    _instrumentation = None
+
+
+def instrumentation_snapshot():
+    """
+    Returns the statistics of the instrumented templates still alive, or None
+    when instrumentation is disabled.
+    """
+    instrumentation = _instrumentation
+    return None if instrumentation is None else instrumentation.snapshot()
+
+
+MODE_TREE = 'tree'
+MODE_CODEGEN = 'codegen'
+MODE_BDD = 'bdd'
+
+
+def compile(file, mode=MODE_TREE, cache_size=None, variants=False, optimize=False, dialect=None, constraints=None):
+    started = perf_counter()
+    name = getattr(file, 'name', None)
+    return _finish(compile_template(file, dialect), mode, cache_size, variants, optimize, constraints,
+                   name if isinstance(name, str) else None, started)
+
+
+def compiles(text, mode=MODE_TREE, cache_size=None, variants=False, optimize=False, dialect=None, constraints=None):
+    started = perf_counter()
+    return _finish(compile_template(text.split(LINEBREAK), dialect), mode, cache_size, variants, optimize,
+                   constraints, None, started)
 
-    if not isinstance(prefix, str):
-        raise ValueError
 
-    allowed_chars = string.digits + string.ascii_letters + string.punctuation
-    for c in prefix:
-        if c not in allowed_chars:
-            raise ValueError
+def compile_path(path, mode=MODE_TREE, cache_size=None, variants=False, optimize=False, encoding='utf-8',
+                 dialect=None, constraints=None):
+    """
+    Compiles a template file by memory-mapping it. The text of the template is
+    kept as spans of the mapped file and only decoded when rendered.
+    """
+    from ppdpy.mapped import compile_path as compile_mapped
+    started = perf_counter()
+    return _finish(compile_mapped(path, encoding, dialect), mode, cache_size, variants, optimize, constraints,
+                   path, started)
 
+
+def compile_dir(root, pattern='*', workers=None, mode=MODE_TREE, cache_size=None, variants=False, optimize=False,
+                encoding='utf-8', dialect=None, constraints=None):
+    """
+    Compiles the template files under `root` whose names match `pattern` in a
+    pool of `workers` processes. Returns a dict of templates keyed by path
+    relative to `root`, whose `errors` attribute holds the exceptions of the
+    files that failed to compile.
+    """
+    from ppdpy.artifacts import compile_dir as compile_artifacts
+    result = compile_artifacts(root, pattern, workers, encoding, dialect)
+    for name, template in result.items():
+        # compiled in the workers, so there is no compile time to record
+        result[name] = _finish(template, mode, cache_size, variants, optimize, constraints, name)
+
+    return result
+
+
+async def acompile(lines, mode=MODE_TREE, cache_size=None, variants=False, optimize=False, encoding='utf-8',
+                   dialect=None, constraints=None):
+    """
+    Compiles a template from an asynchronous iterable of lines (str, or bytes
+    decoded with `encoding`), yielding to the event loop while parsing.
+    """
+    from ppdpy.aio import acompile as compile_async
+    started = perf_counter()
+    return _finish(await compile_async(lines, dialect, encoding), mode, cache_size, variants, optimize,
+                   constraints, None, started)
+
+
+def _finish(template, mode, cache_size, variants, optimize, constraints=None, name=None, started=None, key=None):
+    if constraints is not None:
+        template = template.constrain(constraints)
+
+    pruned = template.pruned
+
+    if optimize:
+        from ppdpy.optimizer import optimize as optimize_template
+        template = optimize_template(template)
+
+    if mode == MODE_CODEGEN:
+        from ppdpy.codegen import CodegenTemplate
+        template = CodegenTemplate(template._blocks, template._symbols)
+
+    elif mode == MODE_BDD:
+        from ppdpy.bdd import BddTemplate
+        template = BddTemplate(template._blocks, template._symbols)
+
+    elif mode != MODE_TREE:
+        raise ValueError('unknown compile mode ' + repr(mode))
+
+    # kept across the templates rebuilt below
+    template.pruned = pruned
+
+    if cache_size:
+        template.enable_cache(cache_size)
+
+    if variants:
+        template.precompute_variants()
+
+    instrumentation = _instrumentation
+    if instrumentation is not None:
+        compile_time = None if started is None else perf_counter() - started
+        instrumentation.attach(template, name, compile_time, key)
+
+    return template
+
+
+def set_directive_prefix(prefix):
+    """
+    Sets the directive prefix of the default dialect, used when no dialect is
+    given to compile. Templates already compiled are not affected.
+    """
+    import ppdpy.template_compiler
     ppdpy.template_compiler.set_directive_prefixes(prefix)
@@ -0,0 +1,37 @@
+import argparse
+import sys
+
+from ppdpy.artifacts import find_templates, precompile_path
+from ppdpy.dialect import Dialect
+from ppdpy.exceptions import PpdPyError
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ppdpy')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    precompile = commands.add_parser('precompile', help='write precompiled artifacts of a directory of templates')
+    precompile.add_argument('root', help='directory searched recursively for templates')
+    precompile.add_argument('--pattern', default='*', help='file name pattern of the templates (default: *)')
+    precompile.add_argument('--encoding', default='utf-8', help='encoding of the templates (default: utf-8)')
+    precompile.add_argument('--prefix', type=Dialect, default=Dialect(), dest='dialect', metavar='PREFIX',
+                            help='directive prefix of the templates (default: #)')
+
+    args = parser.parse_args(argv)
+
+    status = 0
+    for path in find_templates(args.root, args.pattern):
+        try:
+            print(precompile_path(path, encoding=args.encoding, dialect=args.dialect))
+
+        except Exception as e:
+            message = e.message if isinstance(e, PpdPyError) else '%s: %s' % (e.__class__.__name__, e)
+            print('%s: error: %s' % (path, message), file=sys.stderr)
+            status = 1
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+asyncio support: compiling templates from asynchronous line sources, and
+rendering to asynchronous writers.
+
+Both cooperate with the event loop, yielding to it every so often, so that
+large templates neither block it on reads nor monopolize it while rendering.
+"""
+import asyncio
+
+from ppdpy.template_compiler import _Parser, _TextBuilder
+
+# lines parsed between two yields to the event loop
+_LINES_PER_YIELD = 4096
+
+
+async def acompile(lines, dialect=None, encoding='utf-8'):
+    """
+    Compiles a template from an asynchronous iterable of lines, such as an
+    asyncio StreamReader. Lines given as bytes are decoded with `encoding`.
+    """
+    parser = _Parser(_TextBuilder, dialect)
+    count = 0
+
+    async for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode(encoding)
+
+        parser.feed(line)
+        count += 1
+        if count == _LINES_PER_YIELD:
+            count = 0
+            await asyncio.sleep(0)
+
+    return parser.finish()
+
+
+async def arender_to(template, writer, symbols, encoding='utf-8', buffer_size=1 << 16):
+    """
+    Renders a template to an asyncio StreamWriter (or any object with a
+    `write(bytes)` method and an awaitable `drain()`). The output is written
+    in pieces of about `buffer_size` bytes, waiting on `drain` after each one,
+    so a slow reader holds the rendering back instead of filling the memory.
+    """
+    parts = []
+    size = 0
+
+    for chunk in template.iter_render(symbols):
+        data = chunk.encode(encoding)
+        parts.append(data)
+        size += len(data)
+
+        if size >= buffer_size:
+            writer.write(b''.join(parts))
+            parts = []
+            size = 0
+            await writer.drain()
+            # drain returns right away while the transport is below its
+            # high-water mark, so give other tasks a turn explicitly
+            await asyncio.sleep(0)
+
+    if parts:
+        writer.write(b''.join(parts))
+        await writer.drain()
@@ -0,0 +1,292 @@
+"""
+Precompiled template artifacts.
+
+A compiled template is serialized with `marshal`, with its expressions as
+flat programs (see `ppdpy.program`), so loading it skips lexing and parsing.
+Artifacts hold no python code: the expression tests are generated again on
+their first evaluation, as for any compiled template. Artifacts are keyed by
+the hash of the template source, the ppdpy version and the python bytecode
+version; loading an artifact with a different key raises
+`StaleArtifactError`.
+"""
+from array import array
+import fnmatch
+import hashlib
+import io
+import marshal
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from ppdpy.exceptions import StaleArtifactError
+from ppdpy.program import Program
+from ppdpy.symbols import SymbolTable
+from ppdpy.template_compiler import compile as compile_template, default_dialect, Template, TextBlock, IfBlock, IfEntry, ElseEntry
+from ppdpy.version import __version__
+
+ARTIFACT_SUFFIX = '.ppdc'
+
+_MAGIC = 'ppdpy-artifact'
+_FORMAT = 5
+
+
+def source_hash(source:bytes) -> str:
+    """
+    Returns the hash used to key the artifacts of a template source.
+    """
+    return hashlib.sha256(source).hexdigest()
+
+
+def dumps(template:Template, source_hash:str, dialect=None) -> bytes:
+    """
+    Serializes a template compiled with the given dialect (by default, the
+    default one).
+    """
+    payload = (tuple(template._symbols), _dump_blocks(template._blocks))
+    return marshal.dumps((_MAGIC, _key(source_hash, dialect), payload))
+
+
+def loads(data:bytes, source_hash:str, dialect=None) -> Template:
+    """
+    Loads a template serialized by `dumps`, checking that it was made from the
+    source with the given hash and dialect by the running ppdpy and python
+    versions.
+    """
+    try:
+        magic, key, payload = marshal.loads(data)
+
+    except (EOFError, ValueError, TypeError):
+        raise StaleArtifactError('invalid template artifact')
+
+    if magic != _MAGIC:
+        raise StaleArtifactError('invalid template artifact')
+
+    if key != _key(source_hash, dialect):
+        raise StaleArtifactError()
+
+    ids, blocks = payload
+    symbol_table = SymbolTable(ids)
+    return Template(_load_blocks(blocks, symbol_table), symbol_table)
+
+
+def _key(source_hash, dialect):
+    if dialect is None:
+        dialect = default_dialect()
+
+    return (_FORMAT, __version__, sys.implementation.cache_tag, source_hash, dialect.prefix)
+
+
+# the block tree is stored as a flat sequence of instructions, so that deeply
+# nested templates do not hit the nesting limits of marshal
+_TEXT = 0
+_BLOCK = 1
+_IF = 2
+_ELSE = 3
+_END = 4
+
+
+def _dump_blocks(blocks):
+    result = []
+    pending = [iter(blocks)]
+
+    while pending:
+        for item in pending[-1]:
+            if isinstance(item, TextBlock):
+                result.append((_TEXT, item.text))
+                continue
+
+            if isinstance(item, IfBlock):
+                result.append((_BLOCK,))
+                pending.append(iter(item._if_entries))
+
+            elif isinstance(item, IfEntry):
+                program = Program.from_node(item._expression)
+                result.append((_IF, *_pack(program.code), program.ids))
+                pending.append(iter(item._blocks))
+
+            else:
+                result.append((_ELSE,))
+                pending.append(iter(item._blocks))
+
+            break
+
+        else:
+            pending.pop()
+            if pending:
+                # ends the entries of an if block, or the blocks of an entry
+                result.append((_END,))
+
+    return tuple(result)
+
+
+def _pack(code):
+    """
+    Returns the typecode and bytes of the smallest array that holds the code
+    of a program.
+    """
+    largest = max(code)
+    typecode = 'B' if largest < 1 << 8 else 'H' if largest < 1 << 16 else 'i'
+    return typecode, array(typecode, code).tobytes()
+
+
+def _load_blocks(instructions, symbol_table):
+    # the lists being loaded, with the instruction that opened each one
+    stack = [[]]
+    headers = [None]
+    tests = {}
+
+    for instruction in instructions:
+        op = instruction[0]
+        if op == _TEXT:
+            stack[-1].append(TextBlock(instruction[1]))
+            continue
+
+        if op != _END:
+            stack.append([])
+            headers.append(instruction)
+            continue
+
+        items = stack.pop()
+        header = headers.pop()
+        if header[0] == _BLOCK:
+            stack[-1].append(IfBlock(items))
+
+        elif header[0] == _IF:
+            code = array(header[1])
+            code.frombytes(header[2])
+            stack[-1].append(IfEntry(Program(code, header[3]).to_node(), items, symbol_table, tests=tests))
+
+        else:
+            stack[-1].append(ElseEntry(items))
+
+    return stack[0]
+
+
+def precompile_path(path, artifact_path=None, encoding='utf-8', dialect=None):
+    """
+    Compiles the template file at `path` and writes its artifact, by default
+    next to it with the `.ppdc` suffix. Returns the artifact path.
+    """
+    if artifact_path is None:
+        artifact_path = path + ARTIFACT_SUFFIX
+
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    template = _compile_source(source, encoding, dialect)
+    with open(artifact_path, 'wb') as f:
+        f.write(dumps(template, source_hash(source), dialect))
+
+    return artifact_path
+
+
+def load_path(path, artifact_path=None, encoding='utf-8', dialect=None):
+    """
+    Loads the template file at `path` from its artifact, or compiles it from
+    source when the artifact is missing or stale.
+    """
+    if artifact_path is None:
+        artifact_path = path + ARTIFACT_SUFFIX
+
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    try:
+        with open(artifact_path, 'rb') as f:
+            return loads(f.read(), source_hash(source), dialect)
+
+    except (OSError, StaleArtifactError):
+        return _compile_source(source, encoding, dialect)
+
+
+def precompile_dir(root, pattern='*', encoding='utf-8', dialect=None):
+    """
+    Writes the artifacts of all the template files under `root` whose names
+    match `pattern`. Returns the list of artifact paths.
+    """
+    result = []
+    for path in find_templates(root, pattern):
+        result.append(precompile_path(path, encoding=encoding, dialect=dialect))
+
+    return result
+
+
+class TemplateDir(dict):
+    """
+    The templates compiled from a directory, keyed by their path relative to
+    it. `errors` maps the relative paths of the files that failed to compile
+    to their exception.
+    """
+    def __init__(self, templates=(), errors=None):
+        super().__init__(templates)
+        self.errors = {} if errors is None else errors
+
+
+def compile_dir(root, pattern='*', workers=None, encoding='utf-8', dialect=None):
+    """
+    Compiles all the template files under `root` whose names match `pattern`,
+    spreading them over `workers` processes (by default, one per cpu). The
+    templates are sent back to this process serialized as artifacts, which
+    load much faster than they compile. Files that fail to compile are
+    reported in the `errors` of the result instead of stopping the others.
+    """
+    if dialect is None:
+        # the worker processes do not share the default dialect of this one
+        dialect = default_dialect()
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    paths = list(find_templates(root, pattern))
+    jobs = [(path, encoding, dialect) for path in paths]
+
+    if workers > 1 and len(jobs) > 1:
+        workers = min(workers, len(jobs))
+        with ProcessPoolExecutor(workers) as executor:
+            # a few chunks per worker, balancing the load with little overhead
+            results = list(executor.map(_compile_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+    else:
+        results = map(_compile_job, jobs)
+
+    result = TemplateDir()
+    for path, (hash, data, error) in zip(paths, results):
+        name = os.path.relpath(path, root)
+        if error is None:
+            result[name] = loads(data, hash, dialect)
+
+        else:
+            result.errors[name] = error
+
+    return result
+
+
+def _compile_job(job):
+    path, encoding, dialect = job
+    try:
+        with open(path, 'rb') as f:
+            source = f.read()
+
+        hash = source_hash(source)
+        return hash, dumps(_compile_source(source, encoding, dialect), hash, dialect), None
+
+    except Exception as e:
+        # any failure is reported for its file, without aborting the others
+        return None, None, e
+
+
+def find_templates(root, pattern='*'):
+    """
+    Yields the paths of the files under `root` whose names match `pattern`,
+    skipping artifacts.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if fnmatch.fnmatch(filename, pattern) and not filename.endswith(ARTIFACT_SUFFIX):
+                yield os.path.join(dirpath, filename)
+
+
+def _compile_source(source, encoding, dialect=None):
+    # decodes the same way as iterating over a file opened in text mode
+    return compile_template(io.TextIOWrapper(io.BytesIO(source), encoding=encoding), dialect)
@@ -0,0 +1,407 @@
+"""
+Reduced ordered binary decision diagrams for if blocks.
+
+Each if block of a template is turned into a diagram whose inner nodes test
+one symbol of the template and whose leaves are the index of the entry taken.
+Symbols are tested in the order of their bits, so selecting the entry of an
+if/elif chain tests each referenced symbol at most once, however many
+entries mention it.
+"""
+from ppdpy.nodes import Id, Const, Not, And
+from ppdpy.template_compiler import Template, IfBlock, IfEntry, LINEBREAK, _chunks
+
+# the level of the leaves, below every variable
+_LEAF = float('inf')
+
+
+class Diagram:
+    """
+    A store of shared, reduced diagram nodes. Node 0 and 1 are the false and
+    true leaves; other leaves hold arbitrary hashable values.
+    """
+    FALSE = 0
+    TRUE = 1
+
+    def __init__(self):
+        # per node: the level (bit position) tested, the bit mask tested, and
+        # the nodes followed when the symbol is absent and present. Leaves
+        # have a zero mask and keep their value in `low`.
+        self.levels = []
+        self.bits = []
+        self.low = []
+        self.high = []
+        self._unique = {}
+        self._ite = {}
+        self._apply = {}
+        self.leaf(False)
+        self.leaf(True)
+
+    def leaf(self, value):
+        # the class tells apart leaves such as 1 and True, which are equal
+        return self._make(('leaf', value.__class__, value), _LEAF, 0, value, None)
+
+    def variable(self, level:int):
+        return self.node(level, self.FALSE, self.TRUE)
+
+    def node(self, level:int, low:int, high:int):
+        if low == high:
+            return low
+
+        return self._make((level, low, high), level, 1 << level, low, high)
+
+    def _make(self, key, level, bit, low, high):
+        n = self._unique.get(key)
+        if n is None:
+            n = self._unique[key] = len(self.levels)
+            self.levels.append(level)
+            self.bits.append(bit)
+            self.low.append(low)
+            self.high.append(high)
+
+        return n
+
+    def ite(self, f:int, g:int, h:int) -> int:
+        """
+        Returns the diagram of "if f then g else h", for a boolean diagram f
+        and diagrams g and h with any leaves. The cofactors are computed with
+        an explicit stack, so any number of symbols can be combined.
+        """
+        result = self._ite_result(f, g, h)
+        if result is not None:
+            return result
+
+        memo = self._ite
+        levels = self.levels
+        root = (f, g, h)
+        pending = [(root, False)]
+
+        while pending:
+            key, ready = pending.pop()
+            if key in memo:
+                continue
+
+            a, b, c = key
+            level = min(levels[a], levels[b], levels[c])
+            f0, f1 = self._cofactors(a, level)
+            g0, g1 = self._cofactors(b, level)
+            h0, h1 = self._cofactors(c, level)
+            low = (f0, g0, h0)
+            high = (f1, g1, h1)
+
+            if ready:
+                memo[key] = self.node(level, self._ite_result(*low), self._ite_result(*high))
+                continue
+
+            pending.append((key, True))
+            for cofactor in (low, high):
+                if self._ite_result(*cofactor) is None:
+                    pending.append((cofactor, False))
+
+        return memo[root]
+
+    def _ite_result(self, f, g, h):
+        """
+        Returns the result of ite when it is trivial or already computed,
+        otherwise None.
+        """
+        if f == self.TRUE or g == h:
+            return g
+
+        elif f == self.FALSE:
+            return h
+
+        return self._ite.get((f, g, h))
+
+    def apply(self, operator, f:int, g:int) -> int:
+        """
+        Combines two diagrams, joining the values of their leaves with
+        `operator(value_f, value_g)`.
+        """
+        result = self._apply_result(operator, f, g)
+        if result is not None:
+            return result
+
+        memo = self._apply
+        levels = self.levels
+        root = (operator, f, g)
+        pending = [(root, False)]
+
+        while pending:
+            key, ready = pending.pop()
+            if key in memo:
+                continue
+
+            a, b = key[1], key[2]
+            level = min(levels[a], levels[b])
+            f0, f1 = self._cofactors(a, level)
+            g0, g1 = self._cofactors(b, level)
+
+            if ready:
+                memo[key] = self.node(level, self._apply_result(operator, f0, g0),
+                                      self._apply_result(operator, f1, g1))
+                continue
+
+            pending.append((key, True))
+            for cofactor in ((operator, f0, g0), (operator, f1, g1)):
+                if self._apply_result(*cofactor) is None:
+                    pending.append((cofactor, False))
+
+        return memo[root]
+
+    def _apply_result(self, operator, f, g):
+        """
+        Returns the result of apply when both nodes are leaves or it is
+        already computed, otherwise None.
+        """
+        if self.bits[f] == 0 and self.bits[g] == 0:
+            return self.leaf(operator(self.low[f], self.low[g]))
+
+        return self._apply.get((operator, f, g))
+
+    def _cofactors(self, n, level):
+        if self.levels[n] == level:
+            return self.low[n], self.high[n]
+
+        return n, n
+
+    def expression(self, node, symbol_table) -> int:
+        """
+        Returns the boolean diagram of an expression.
+        """
+        results = {}
+        pending = [(node, False)]
+
+        while pending:
+            n, ready = pending.pop()
+            if isinstance(n, Id):
+                results[id(n)] = self.variable(symbol_table.intern(n.id).bit_length() - 1)
+
+            elif isinstance(n, Const):
+                results[id(n)] = self.TRUE if n.value else self.FALSE
+
+            elif not ready:
+                pending.append((n, True))
+                if isinstance(n, Not):
+                    pending.append((n.n, False))
+
+                else:
+                    pending.append((n.left, False))
+                    pending.append((n.right, False))
+
+            elif isinstance(n, Not):
+                results[id(n)] = self.ite(results[id(n.n)], self.FALSE, self.TRUE)
+
+            elif isinstance(n, And):
+                results[id(n)] = self.ite(results[id(n.left)], results[id(n.right)], self.FALSE)
+
+            else:
+                results[id(n)] = self.ite(results[id(n.left)], self.TRUE, results[id(n.right)])
+
+        return results[id(node)]
+
+    def if_block(self, block, symbol_table) -> int:
+        """
+        Returns the diagram of an if block, whose leaves are the index of the
+        entry taken, or the number of entries when none is.
+        """
+        entries = block._if_entries
+        result = self.leaf(len(entries))
+
+        for i in range(len(entries) - 1, -1, -1):
+            entry = entries[i]
+            if isinstance(entry, IfEntry):
+                result = self.ite(self.expression(entry._expression, symbol_table), self.leaf(i), result)
+
+            else:
+                result = self.leaf(i)
+
+        return result
+
+    def select(self, n:int, mask:int):
+        """
+        Follows the diagram for a mask of symbols and returns the leaf value.
+        """
+        bits = self.bits
+        high = self.high
+        low = self.low
+
+        bit = bits[n]
+        while bit:
+            n = high[n] if mask & bit else low[n]
+            bit = bits[n]
+
+        return low[n]
+
+    def count(self, n:int, variables:int) -> dict:
+        """
+        Returns, for each leaf value reachable from the node, the number of
+        masks over `variables` symbols that lead to it.
+        """
+        counts = {}
+        pending = [(n, False)]
+
+        while pending:
+            m, ready = pending.pop()
+            if m in counts:
+                continue
+
+            if self.bits[m] == 0:
+                counts[m] = {self.low[m]: 1}
+
+            elif not ready:
+                pending.append((m, True))
+                pending.append((self.low[m], False))
+                pending.append((self.high[m], False))
+
+            else:
+                total = {}
+                for child in (self.low[m], self.high[m]):
+                    scale = 1 << (self._level(child, variables) - self.levels[m] - 1)
+                    for value, c in counts[child].items():
+                        total[value] = total.get(value, 0) + c * scale
+
+                counts[m] = total
+
+        scale = 1 << self._level(n, variables)
+        return {value: c * scale for value, c in counts[n].items()}
+
+    def _level(self, n, variables):
+        return variables if self.bits[n] == 0 else self.levels[n]
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class BddTemplate(Template):
+    """
+    A compiled text whose if blocks select their entry through a decision
+    diagram.
+    """
+    def __init__(self, blocks=[], symbol_table=None):
+        super().__init__(blocks, symbol_table)
+        self._diagram = diagram = Diagram()
+        # per if block: the root of its diagram, and its entries indexed by
+        # the leaf values, None standing for no entry
+        self._roots = {}
+
+        pending = [blocks]
+        while pending:
+            for block in pending.pop():
+                if block.__class__ is IfBlock:
+                    root = diagram.if_block(block, self._symbols)
+                    self._roots[id(block)] = (root, tuple(block._if_entries) + (None,))
+                    pending.extend(entry._blocks for entry in block._if_entries)
+
+    def select(self, block, mask):
+        """
+        Returns the entry of the if block taken for the mask, or None.
+        """
+        root, entries = self._roots[id(block)]
+        return entries[self._diagram.select(root, mask)]
+
+    def _render(self, mask):
+        parts = []
+        append = parts.append
+        roots = self._roots
+        bits = self._diagram.bits
+        low = self._diagram.low
+        high = self._diagram.high
+        pending = [iter(self._blocks)]
+
+        while pending:
+            for block in pending[-1]:
+                if block.__class__ is not IfBlock:
+                    append(block.text)
+                    continue
+
+                # Diagram.select, inlined
+                n, entries = roots[id(block)]
+                bit = bits[n]
+                while bit:
+                    n = high[n] if mask & bit else low[n]
+                    bit = bits[n]
+
+                entry = entries[low[n]]
+                if entry is not None:
+                    pending.append(iter(entry._blocks))
+                    break
+
+            else:
+                pending.pop()
+
+        return ''.join(parts)[:-len(LINEBREAK)]
+
+    def _iter_apply(self, mask):
+        return _chunks(self._blocks, lambda block: self.select(block, mask))
+
+    def branch_counts(self, block):
+        """
+        Returns, for each entry index of the if block (the number of entries
+        standing for no entry), how many assignments of the template symbols
+        take it.
+        """
+        root, entries = self._roots[id(block)]
+        return self._diagram.count(root, len(self._symbols))
+
+    def decision_count(self):
+        """
+        Returns the number of distinct decision vectors of the template, that
+        is, of sets of branches taken by some assignment of its symbols. This
+        bounds the number of distinct outputs, and so the useful size of a
+        render cache.
+        """
+        return len(self._diagram.count(self.decisions(), len(self._symbols)))
+
+    def decisions(self):
+        """
+        Returns a diagram of the whole template, whose leaves are the decision
+        vectors returned by `_decide`.
+        """
+        diagram = self._diagram
+        roots = self._roots
+
+        # the diagram of each if block including its nested blocks, built
+        # from the innermost if blocks outwards
+        if_blocks = []
+        pending = [self._blocks]
+        while pending:
+            for block in pending.pop():
+                if block.__class__ is IfBlock:
+                    if_blocks.append(block)
+                    pending.extend(entry._blocks for entry in block._if_entries)
+
+        nested = {}
+        for block in reversed(if_blocks):
+            root, entries = roots[id(block)]
+            result = None
+            for i, entry in enumerate(entries):
+                blocks = [] if entry is None else entry._blocks
+                taken = diagram.apply(_concat, diagram.leaf((i,)), _sequence(diagram, blocks, nested))
+                if result is None:
+                    result = taken
+
+                else:
+                    # the leaves of the block diagram partition the masks
+                    chosen = diagram.apply(_equal, root, diagram.leaf(i))
+                    result = diagram.ite(chosen, taken, result)
+
+            nested[id(block)] = result
+
+        return _sequence(diagram, self._blocks, nested)
+
+
+def _sequence(diagram, blocks, nested):
+    result = diagram.leaf(())
+    for block in blocks:
+        if block.__class__ is IfBlock:
+            result = diagram.apply(_concat, result, nested[id(block)])
+
+    return result
+
+
+def _concat(first, second):
+    return first + second
+
+
+def _equal(value, expected):
+    return value == expected
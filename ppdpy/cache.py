@@ -0,0 +1,122 @@
+import os
+from threading import Event, Lock
+
+from ppdpy.template_compiler import compile as compile_template, default_dialect, LINEBREAK
+from ppdpy.utility import LRUCache
+
+
+class CompileCache:
+    """
+    A bounded, thread-safe cache of compiled templates, used by `ppdpy.render`
+    and `ppdpy.renders` when enabled with `ppdpy.enable_compile_cache`.
+
+    Texts are keyed by their contents, and files by their path, modification
+    time and size, along with the dialect they are compiled with. Concurrent
+    requests for the same uncompiled template wait for a single compilation,
+    done by `compile(source, dialect)` with the text or file.
+    """
+    def __init__(self, maxsize=128, compile=None):
+        self._compile = _compile if compile is None else compile
+        self._templates = LRUCache(maxsize)
+        self._lock = Lock()
+        self._flights = {}
+
+    def compile_text(self, text, dialect=None):
+        if dialect is None:
+            dialect = default_dialect()
+
+        return self.get(('text', text, dialect), lambda: self._compile(text, dialect))
+
+    def compile_file(self, file, dialect=None):
+        if dialect is None:
+            dialect = default_dialect()
+
+        key = _file_key(file)
+        if key is None:
+            # not backed by a file on disk, so there is no way to detect changes
+            return self._compile(file, dialect)
+
+        return self.get(key + (dialect,), lambda: self._compile(file, dialect))
+
+    def get(self, key, compile):
+        """
+        Returns the cached template for the key, calling `compile` to create
+        it if needed. Only one thread compiles a given key at a time; the
+        others wait for its result.
+        """
+        template = self._templates.get(key)
+        if template is not None:
+            return template
+
+        with self._lock:
+            template = self._templates.peek(key)
+            if template is not None:
+                return template
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            template = compile()
+
+        except BaseException as e:
+            flight.error = e
+            raise
+
+        else:
+            self._templates.put(key, template)
+            flight.template = template
+
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+            flight.done.set()
+
+        return template
+
+    def clear(self):
+        self._templates.clear()
+
+    def info(self):
+        return self._templates.info()
+
+
+class _Flight:
+    """
+    A compilation in progress.
+    """
+    def __init__(self):
+        self.done = Event()
+        self.template = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+
+        return self.template
+
+
+def _compile(source, dialect):
+    return compile_template(source.split(LINEBREAK) if isinstance(source, str) else source, dialect)
+
+
+def _file_key(file):
+    try:
+        name = file.name
+        stat = os.fstat(file.fileno())
+
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    if not isinstance(name, str):
+        return None
+
+    return ('file', os.path.abspath(name), stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,104 @@
+from ppdpy.expression_compiler import to_mask_function, to_mask_source, source_depth, MAX_SOURCE_DEPTH
+from ppdpy.template_compiler import Template, TextBlock, IfBlock, IfEntry, LINEBREAK
+
+_INDENT = '    '
+
+# if blocks nested deeper than this are generated as separate functions,
+# keeping the indentation within the limits of the python compiler
+_MAX_LEVEL = 32
+
+
+def generate_source(blocks, symbol_table, name='render', tests=None):
+    """
+    Generates the source of a python function that renders the given blocks
+    for a mask of symbols built by `symbol_table`. Text is inlined as string
+    constants and the if/elif/else chains are turned into native if
+    statements. Expressions too deeply nested to be inlined are appended to
+    the `tests` list and called as `_tests[i](mask)`.
+    """
+    if tests is None:
+        tests = []
+
+    lines = [
+        'def ' + name + '(mask):',
+        _INDENT + 'parts = []',
+        _INDENT + 'append = parts.append',
+    ]
+    # the deeply nested if blocks, generated as functions of their own
+    nested = []
+    _generate_blocks(blocks, symbol_table, 1, lines, nested, tests)
+    lines.append(_INDENT + "return ''.join(parts)[:-" + str(len(LINEBREAK)) + ']')
+
+    for function_name, block in nested:
+        lines.append('def ' + function_name + '(mask, append):')
+        _generate_if(block, symbol_table, 1, lines, nested, tests)
+
+    return '\n'.join(lines) + '\n'
+
+
+def generate(blocks, symbol_table):
+    """
+    Generates a python function that renders the given blocks.
+    """
+    tests = []
+    source = generate_source(blocks, symbol_table, tests=tests)
+    namespace = {'_tests': [to_mask_function(node, symbol_table) for node in tests]}
+    exec(source, namespace)
+    return namespace['render']
+
+
+def _generate_blocks(blocks, symbol_table, level, lines, nested, tests):
+    indent = _INDENT * level
+    start = len(lines)
+
+    for block in blocks:
+        if isinstance(block, TextBlock):
+            if block.text:
+                lines.append(indent + 'append(' + repr(block.text) + ')')
+
+        elif isinstance(block, IfBlock):
+            if level < _MAX_LEVEL:
+                _generate_if(block, symbol_table, level, lines, nested, tests)
+
+            else:
+                function_name = '_if%d' % len(nested)
+                nested.append((function_name, block))
+                lines.append(indent + function_name + '(mask, append)')
+
+        else:
+            raise TypeError('unexpected block ' + repr(block))
+
+    if len(lines) == start:
+        lines.append(indent + 'pass')
+
+
+def _generate_if(block, symbol_table, level, lines, nested, tests):
+    indent = _INDENT * level
+
+    for i, entry in enumerate(block._if_entries):
+        if isinstance(entry, IfEntry):
+            keyword = 'if ' if i == 0 else 'elif '
+            lines.append(indent + keyword + _test_source(entry._expression, symbol_table, tests) + ':')
+
+        else:
+            lines.append(indent + 'else:')
+
+        _generate_blocks(entry._blocks, symbol_table, level + 1, lines, nested, tests)
+
+
+def _test_source(expression, symbol_table, tests):
+    if source_depth(expression) <= MAX_SOURCE_DEPTH:
+        return to_mask_source(expression, symbol_table)
+
+    tests.append(expression)
+    return '_tests[%d](mask)' % (len(tests) - 1)
+
+
+class CodegenTemplate(Template):
+    """
+    A compiled text rendered by a generated python function.
+    """
+    def __init__(self, blocks=[], symbol_table=None):
+        super().__init__(blocks, symbol_table)
+        # shadows Template._render, so render calls the generated function directly
+        self._render = generate(blocks, self._symbols)
@@ -0,0 +1,197 @@
+"""
+Symbol constraints and the dead-branch elimination they allow.
+
+Constraints describe the symbol sets a template is rendered with: groups of
+mutually exclusive symbols, implications between symbols, and symbols that
+are always or never given. `prune` proves with a binary decision diagram which
+entries can never be taken under them, removes those, and simplifies the
+remaining expressions with the symbols their context decides.
+"""
+from collections import namedtuple
+from functools import reduce
+from itertools import combinations
+
+from ppdpy.bdd import Diagram
+from ppdpy.nodes import Id, Const, Not, And, Or, flatten
+from ppdpy.optimizer import Simplifier, rewrite_entries, TRUE, FALSE
+from ppdpy.symbols import SymbolTable
+from ppdpy.template_compiler import Template, IfBlock, IfEntry, _entries
+
+
+PrunedBranch = namedtuple('PrunedBranch', ['index', 'directive', 'expression'])
+
+
+class Constraints(namedtuple('Constraints', ['exclusive', 'implies', 'present', 'absent'])):
+    """
+    Constraints on the symbol sets given to render: at most one symbol of each
+    `exclusive` group, the second symbol of each `implies` pair whenever the
+    first one is given, every `present` symbol and none of the `absent` ones.
+
+        >>> Constraints(exclusive=[{'sort_ascending', 'sort_descending'}],
+        ...             implies=[('select_unread_count', 'join_last_read')])
+    """
+    __slots__ = ()
+
+    def __new__(cls, exclusive=(), implies=(), present=(), absent=()):
+        exclusive = tuple(tuple(sorted(group)) for group in exclusive)
+        implies = tuple((symbol, implied) for symbol, implied in implies)
+        present = frozenset(present)
+        absent = frozenset(absent)
+
+        both = present & absent
+        if both:
+            raise ValueError('symbols both present and absent: ' + ', '.join(sorted(both)))
+
+        return super().__new__(cls, exclusive, implies, present, absent)
+
+    def expression(self):
+        """
+        Returns the expression that holds for the symbol sets satisfying the
+        constraints.
+        """
+        terms = []
+        for group in self.exclusive:
+            terms.extend(Not(And(Id(a), Id(b))) for a, b in combinations(group, 2))
+
+        terms.extend(Or(Not(Id(symbol)), Id(implied)) for symbol, implied in self.implies)
+        terms.extend(Id(symbol) for symbol in sorted(self.present))
+        terms.extend(Not(Id(symbol)) for symbol in sorted(self.absent))
+        return reduce(And, terms, Const(True))
+
+
+def prune(template:Template, constraints:Constraints) -> Template:
+    """
+    Returns a copy of the template without the entries that can never be
+    taken when the symbols satisfy the constraints, and with the expressions
+    of the others simplified. The `pruned` attribute of the result lists the
+    removed entries as `PrunedBranch` tuples, numbered in the order their
+    directives appear in the template; the entries nested in them go along.
+    """
+    diagram = Diagram()
+    symbol_table = SymbolTable()
+    holds = diagram.expression(constraints.expression(), symbol_table)
+    if holds == Diagram.FALSE:
+        raise ValueError('the constraints can never be satisfied')
+
+    simplifier = Simplifier()
+    expressions = {}
+    pruned = set()
+
+    # (blocks, diagram of the symbol sets that reach them)
+    pending = [(template._blocks, holds)]
+    while pending:
+        blocks, reached = pending.pop()
+        for block in blocks:
+            if not isinstance(block, IfBlock):
+                continue
+
+            # the symbol sets that reach the block and none of the entries so far
+            rest = reached
+            for entry in block._if_entries:
+                if isinstance(entry, IfEntry):
+                    test = diagram.expression(entry._expression, symbol_table)
+
+                else:
+                    test = Diagram.TRUE
+
+                taken = diagram.ite(rest, test, Diagram.FALSE)
+                if taken == Diagram.FALSE:
+                    pruned.add(id(entry))
+                    expressions[id(entry)] = FALSE
+                    continue
+
+                if not isinstance(entry, IfEntry) or diagram.ite(rest, test, Diagram.TRUE) == Diagram.TRUE:
+                    # always taken when reached
+                    expressions[id(entry)] = TRUE
+
+                else:
+                    values = _decided(diagram, symbol_table, rest, entry._expression.ids())
+                    expressions[id(entry)] = simplifier.simplify(_assign(entry._expression, values))
+
+                pending.append((entry._blocks, taken))
+                rest = diagram.ite(test, Diagram.FALSE, rest)
+
+    # the entries nested in pruned ones are not visited, and go with them
+    result = rewrite_entries(template, lambda entry: expressions.get(id(entry), FALSE))
+    result.pruned = tuple(_report(template._blocks, pruned))
+    return result
+
+
+def _decided(diagram, symbol_table, context, ids):
+    """
+    Returns the value of each of the identifiers that the context decides.
+    """
+    values = {}
+    for name in ids:
+        variable = diagram.variable(symbol_table.intern(name).bit_length() - 1)
+        # never present within the context
+        if diagram.ite(context, variable, Diagram.FALSE) == Diagram.FALSE:
+            values[name] = False
+
+        # never absent within the context
+        elif diagram.ite(variable, Diagram.FALSE, context) == Diagram.FALSE:
+            values[name] = True
+
+    return values
+
+
+def _assign(node, values):
+    """
+    Returns the expression with the identifiers in `values` replaced by
+    constants.
+    """
+    if not values:
+        return node
+
+    results = {}
+    pending = [(node, False)]
+    while pending:
+        n, ready = pending.pop()
+        if isinstance(n, Id):
+            value = values.get(n.id)
+            results[id(n)] = n if value is None else Const(value)
+
+        elif isinstance(n, Const):
+            results[id(n)] = n
+
+        elif isinstance(n, Not):
+            if ready:
+                results[id(n)] = Not(results[id(n.n)])
+
+            else:
+                pending.append((n, True))
+                pending.append((n.n, False))
+
+        else:
+            kind = And if isinstance(n, And) else Or
+            operands = flatten(n, kind)
+            if ready:
+                results[id(n)] = reduce(kind, [results[id(operand)] for operand in operands])
+
+            else:
+                pending.append((n, True))
+                pending.extend((operand, False) for operand in operands)
+
+    return results[id(node)]
+
+
+def _report(blocks, pruned):
+    first = set()
+    pending = list(blocks)
+    while pending:
+        block = pending.pop()
+        if isinstance(block, IfBlock):
+            first.add(id(block._if_entries[0]))
+            for entry in block._if_entries:
+                pending.extend(entry._blocks)
+
+    for index, entry in enumerate(_entries(blocks)):
+        if id(entry) not in pruned:
+            continue
+
+        if not isinstance(entry, IfEntry):
+            yield PrunedBranch(index, 'else', None)
+
+        else:
+            directive = 'if' if id(entry) in first else 'elif'
+            yield PrunedBranch(index, directive, entry._expression.to_source(lambda id: id))
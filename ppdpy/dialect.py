@@ -0,0 +1,35 @@
+import string
+from collections import namedtuple
+
+_ALLOWED_CHARS = frozenset(string.digits + string.ascii_letters + string.punctuation)
+
+
+class Dialect(namedtuple('Dialect', ['prefix', 'if_directive', 'elif_directive', 'else_directive', 'endif_directive'])):
+    """
+    The directive syntax of a template: the prefix that marks a directive
+    line, and the directive names it gives. Dialects are immutable, so they
+    can be shared by templates compiled concurrently.
+
+        >>> Dialect('--#').if_directive
+        '--#if'
+    """
+    __slots__ = ()
+
+    def __new__(cls, prefix='#'):
+        if not isinstance(prefix, str):
+            raise ValueError('the directive prefix must be a string')
+
+        for c in prefix:
+            if c not in _ALLOWED_CHARS:
+                raise ValueError('invalid directive prefix ' + repr(prefix))
+
+        # directive names are matched in lower case
+        lower = prefix.lower()
+        return super().__new__(cls, prefix, lower + 'if', lower + 'elif', lower + 'else', lower + 'endif')
+
+    def __getnewargs__(self):
+        # the directive names are derived from the prefix
+        return (self.prefix,)
+
+
+DEFAULT_DIALECT = Dialect('#')
@@ -9,3 +9,8 @@ class DirectiveSyntaxError(PpdPyError):
 class ExpressionSyntaxError(PpdPyError):
     def __init__(self, message:str='invalid expression syntax'):
         self.message = message
+
+
+class StaleArtifactError(PpdPyError):
+    def __init__(self, message:str='stale or invalid template artifact'):
+        self.message = message
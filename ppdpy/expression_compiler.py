@@ -1,6 +1,9 @@
+import re
+from itertools import product
+
 from ppdpy.nodes import *
 from ppdpy.exceptions import ExpressionSyntaxError
-from ppdpy.utility import listview
+from ppdpy.program import Program
 
 LP = '('
 RP = ')'
@@ -9,199 +12,272 @@ TK_AND = 'and'
 TK_OR = 'or'
 TK_NOT = 'not'
 
+# expressions nested deeper than this are not turned into python source, which
+# the python compiler rejects past about 200 nested parentheses
+MAX_SOURCE_DEPTH = 64
+
+# a token is a parenthesis or a run of chars other than spaces and parens
+_TOKEN = re.compile(r'[()]|[^ ()]+')
+
+# every capitalization of the operators, mapped to the lower case one
+_OPERATORS = {''.join(chars): op for op in (TK_AND, TK_OR, TK_NOT) for chars in product(*zip(op, op.upper()))}
+
 
 def compile(x):
-    return parse(list(lex(x)))
+    return parse(lex(x))
 
 
-def lex(text:str):
+def compile_function(x):
     """
-    Splits a text to a list of tokens.
+    Compiles an expression text straight to a python callable.
     """
-    token = ''
-    for char in text:
-        if char == ' ':
-            if token:
-                yield _clear_op(token)
-                token = ''
+    return to_function(compile(x))
 
-            continue
 
-        elif char == LP:
-            if token:
-                yield _clear_op(token)
-                token = ''
+def to_function(node:Node):
+    """
+    Generates a flat python function equivalent to `node.eval`, so the whole
+    expression is evaluated as a single inlined boolean expression.
+    Expressions too deeply nested for the python compiler are left to
+    `node.eval`.
+    """
+    if source_depth(node) > MAX_SOURCE_DEPTH:
+        return node.eval
 
-            yield LP
+    source = 'lambda symbols: ' + node.to_source(_symbol_test)
+    return eval(source, {})
 
-        elif char == RP:
-            if token:
-                yield _clear_op(token)
-                token = ''
 
-            yield RP
+def _symbol_test(id:str) -> str:
+    return repr(id) + ' in symbols'
 
-        else:
-            token += char
 
-    if token:
-        yield _clear_op(token)
-        token = ''
+def to_mask_function(node:Node, symbol_table, functions=None):
+    """
+    Generates a python function equivalent to `node.eval` that receives the
+    symbols as an integer mask built by `symbol_table` (see
+    `ppdpy.symbols.SymbolTable`), so identifiers are tested with integer
+    operations instead of set lookups. Expressions too deeply nested for the
+    python compiler are run as a `ppdpy.program.Program` instead. The
+    functions generated are shared through the `functions` dict, when given.
+    """
+    if source_depth(node) > MAX_SOURCE_DEPTH:
+        return Program.from_node(node).mask_function(symbol_table)
 
+    source = 'lambda mask: ' + to_mask_source(node, symbol_table)
+    if functions is None:
+        return eval(source, {})
 
-def _clear_op(token):
-    tl = token.lower()
-    return tl if tl in (TK_AND, TK_OR, TK_NOT) else token
+    function = functions.get(source)
+    if function is None:
+        function = functions[source] = eval(source, {})
 
+    return function
 
-def parse(tokens):
-    try:
-        if len(tokens) == 0:
-            raise ExpressionSyntaxError('empty expression')
 
-        node, remainder = _parse_expr(listview(tokens))
+def source_depth(node:Node) -> int:
+    """
+    Returns how many parentheses deep the python source of the expression
+    nests: one per negation and per chain of the same operator.
+    """
+    result = 0
+    pending = [(node, 1)]
+    while pending:
+        n, depth = pending.pop()
+        if isinstance(n, Not):
+            pending.append((n.n, depth + 1))
 
-        if remainder:
-            raise ExpressionSyntaxError()
+        elif isinstance(n, (And, Or)):
+            pending.extend((operand, depth + 1) for operand in flatten(n, n.__class__))
 
-        return node
+        elif depth > result:
+            result = depth
 
-    except StopIteration:
-        raise ExpressionSyntaxError
+    return result
 
 
-def _parse_expr(tokens):
+def to_mask_source(node:Node, symbol_table, mask='mask') -> str:
     """
-    Tries to parse a new expression, beginning with the left side of it.
+    Returns a python expression equivalent to `node`, testing the identifiers
+    against the integer variable named `mask`. Chains of identifiers are
+    merged into a single test, e.g. `a and b` becomes `mask & 3 == 3`.
     """
-    head, tail = tokens.walk()
+    if isinstance(node, Id):
+        return '(%s & %s != 0)' % (mask, _literal(symbol_table.intern(node.id)))
 
-    if head == TK_NOT:
-        # parses: not TOKEN
-        return _parse_expr_not(tail)
+    elif isinstance(node, Const):
+        return repr(node.value)
 
-    elif head == LP:
-        # parses: (EXPRESSION)
-        node, remainder = _parse_parens_contents(tokens)
-        return _parse_cont(node, remainder)
+    elif isinstance(node, Not):
+        if isinstance(node.n, Id):
+            return '(%s & %s == 0)' % (mask, _literal(symbol_table.intern(node.n.id)))
 
-    elif _is_id(head):
-        # parses: ID
-        node = _parse_id(head)
-        return _parse_cont(node, tail)
+        return '(not ' + to_mask_source(node.n, symbol_table, mask) + ')'
 
-    else:
-        raise ExpressionSyntaxError('error parsing expression beginning')
+    kind = And if isinstance(node, And) else Or
+    positive = 0
+    negative = 0
+    terms = []
 
+    for operand in flatten(node, kind):
+        if isinstance(operand, Id):
+            positive |= symbol_table.intern(operand.id)
+
+        elif isinstance(operand, Not) and isinstance(operand.n, Id):
+            negative |= symbol_table.intern(operand.n.id)
+
+        else:
+            terms.append(to_mask_source(operand, symbol_table, mask))
 
-def _parse_expr_not(tokens):
-    head = tokens.head
+    if kind is And:
+        # all the positive bits set, none of the negative ones
+        if negative:
+            terms.insert(0, '(%s & %s == 0)' % (mask, _literal(negative)))
 
-    if _is_id(head):
-        # parses: not ID
-        node = Not(_parse_id(head))
-        return _parse_cont(node, tokens.tail)
+        if positive:
+            terms.insert(0, '(%s & %s == %s)' % (mask, _literal(positive), _literal(positive)))
 
-    elif head == LP:
-        # parses: not (EXPRESSION)
-        node, remainder = _parse_parens_contents(tokens)
-        return _parse_cont(Not(node), remainder)
+        operator = ' and '
 
     else:
-        raise ExpressionSyntaxError()
+        # any of the positive bits set, or any of the negative ones clear
+        if negative:
+            terms.insert(0, '(%s & %s != %s)' % (mask, _literal(negative), _literal(negative)))
+
+        if positive:
+            terms.insert(0, '(%s & %s != 0)' % (mask, _literal(positive)))
+
+        operator = ' or '
+
+    return terms[0] if len(terms) == 1 else '(' + operator.join(terms) + ')'
+
+
+def _literal(bits:int) -> str:
+    """
+    Returns the python literal of a mask, in hex past 64 bits: python limits
+    the decimal digits of the ints it converts to text, which the masks of
+    templates with thousands of symbols exceed.
+    """
+    return str(bits) if bits >> 64 == 0 else hex(bits)
 
 
-def _parse_cont(left, tokens):
+def lex(text:str):
     """
-    Tries to parse an operator and the right side of the expression.
+    Splits a text to a list of tokens.
+    """
+    operators = _OPERATORS
+    return [operators.get(token, token) for token in _TOKEN.findall(text)]
+
+
+def parse(tokens):
+    """
+    Parses a list of tokens into an expression tree.
+
+    The parser is iterative: each open parenthesis pushes a group that
+    collects the operands of its `or` terms and of the current `and` term,
+    so nesting and long chains do not recurse. Chains of the same operator
+    are built as balanced trees.
     """
     if len(tokens) == 0:
-        # nothing left to parse
-        return left, []
+        raise ExpressionSyntaxError('empty expression')
 
-    head, tail = tokens.walk()
+    # the open groups, the outermost one being the whole expression
+    stack = [_Group(False)]
+    expect_operand = True
+    negate = False
+    # the pending operand is the right side of an and
+    after_and = False
 
-    if head == RP:
-        # found a closing parens
-        return left, tokens
+    for token in tokens:
+        group = stack[-1]
 
-    elif head == TK_OR:
-        # parses: LEFT or RIGHT
-        # does a late binding on "left or right" (low precedence)
-        right, remainder = _parse_expr(tail)
-        return Or(left, right), remainder
+        if expect_operand:
+            if token == TK_NOT and not negate:
+                negate = True
+                after_and = False
 
-    elif head == TK_AND:
-        # parses: LEFT and RIGHT
-        return _parse_cont_and(left, tail)
+            elif token == LP:
+                stack.append(_Group(negate))
+                negate = False
+                after_and = False
 
-    else:
-        raise ExpressionSyntaxError()
+            elif _is_id(token):
+                node = Id(token)
+                group.factors.append(Not(node) if negate else node)
+                negate = False
+                expect_operand = False
+                after_and = False
 
+            elif negate:
+                raise ExpressionSyntaxError()
 
-def _parse_cont_and(left, tokens):
-    # parses: LEFT and RIGHT
-    # Does an early binding on "left and right" (high precedence)
-    head, tail = tokens.walk()
+            elif after_and:
+                raise ExpressionSyntaxError('unexpected token after and')
 
-    if _is_id(head):
-        # parses: LEFT and ID
-        right = _parse_id(head)
-        node = And(left, right)
-        return _parse_cont(node, tail)
+            else:
+                raise ExpressionSyntaxError('error parsing expression beginning')
 
-    elif head == LP:
-        # parses: LEFT and (EXPRESSION)
-        right, remainder = _parse_parens_contents(tokens)
-        node = And(left, right)
-        return _parse_cont(node, remainder)
+        elif token == TK_AND:
+            expect_operand = True
+            after_and = True
 
-    elif head == TK_NOT:
-        head2 = tail.head
+        elif token == TK_OR:
+            group.end_term()
+            expect_operand = True
 
-        if _is_id(head2):
-            # parses: LEFT and not ID
-            right = Not(_parse_id(head2))
-            node = And(left, right)
-            return _parse_cont(node, tail.tail)
+        elif token == RP:
+            if len(stack) == 1:
+                raise ExpressionSyntaxError()
 
-        elif head2 == LP:
-            # parses: LEFT and not (EXPRESSION)
-            right, remainder = _parse_parens_contents(tail)
-            node = And(left, Not(right))
-            return _parse_cont(node, remainder)
+            stack.pop()
+            node = group.node()
+            stack[-1].factors.append(Not(node) if group.negate else node)
 
         else:
             raise ExpressionSyntaxError()
 
-    else:
-        raise ExpressionSyntaxError('unexpected token after and')
+    if expect_operand:
+        raise ExpressionSyntaxError()
 
+    if len(stack) > 1:
+        raise ExpressionSyntaxError('right parens expected')
 
-def _parse_parens_contents(tokens):
-    head, tail = tokens.walk()
+    return stack[0].node()
 
-    if head != LP:
-        raise ExpressionSyntaxError('left parens expected')
 
-    node, remainder = _parse_expr(tail)
-    if not remainder:
-        raise ExpressionSyntaxError('right parens expected')
+class _Group:
+    """
+    A parenthesized expression being parsed.
+    """
+    __slots__ = ['negate', 'terms', 'factors']
 
-    elif remainder.head == RP:
-        return node, remainder.tail
+    def __init__(self, negate):
+        self.negate = negate
+        self.terms = []
+        self.factors = []
 
-    else:
-        raise ExpressionSyntaxError('right parens expected')
+    def end_term(self):
+        self.terms.append(balance(And, self.factors))
+        self.factors = []
 
+    def node(self):
+        self.end_term()
+        return balance(Or, self.terms)
 
 
-def _parse_id(token:str) -> Id:
-    if not _is_id(token):
-        raise ExpressionSyntaxError()
+def balance(kind, operands, start=0, end=None):
+    """
+    Combines the operands with the `kind` operator (And or Or) as a balanced
+    tree, e.g. `[a, b, c, d]` becomes `kind(kind(a, b), kind(c, d))`.
+    """
+    if end is None:
+        end = len(operands)
 
-    else:
-        return Id(token)
+    if end - start == 1:
+        return operands[start]
+
+    middle = (start + end) // 2
+    return kind(balance(kind, operands, start, middle), balance(kind, operands, middle, end))
 
 
 def _is_id(token:str) -> bool:
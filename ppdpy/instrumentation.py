@@ -0,0 +1,134 @@
+import weakref
+from collections import namedtuple, Counter
+from threading import Lock
+
+from ppdpy.template_compiler import _chunks, _entries
+
+
+TemplateStats = namedtuple('TemplateStats', ['name', 'compiles', 'compile_time', 'renders', 'render_time',
+                                             'branches'])
+
+
+class Instrumentation:
+    """
+    Records the compile time, render count and cumulative render time of the
+    templates attached to it, and how often each of their #if, #elif and #else
+    entries is selected. Used by `ppdpy` when enabled with
+    `ppdpy.enable_instrumentation`.
+
+    Attached templates report every render, iter_render, render_to and
+    render_many to it, while the templates compiled when it is disabled render
+    without any overhead. Templates attached with a `key` share the statistics
+    of that key, which are kept as long as the instrumentation; the others are
+    held weakly, and their statistics go away with them.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = Lock()
+        # the counters of every attached template, and of every key
+        self._counters = weakref.WeakKeyDictionary()
+        self._shared = {}
+
+    def attach(self, template, name=None, compile_time=None, key=None):
+        """
+        Instruments the renders of a template, and reports its compilation
+        when `compile_time` is given.
+        """
+        index = {id(entry): i for i, entry in enumerate(_entries(template._blocks))}
+        with self._lock:
+            if key is None:
+                counters = _Counters(name, len(index))
+
+            else:
+                counters = self._shared.get(key)
+                if counters is None or len(counters.hits) != len(index):
+                    # new, or compiled from a source that changed since
+                    counters = self._shared[key] = _Counters(name, len(index))
+
+            self._counters[template] = counters
+
+            if compile_time is not None:
+                counters.compiles += 1
+                counters.compile_time = (counters.compile_time or 0.0) + compile_time
+
+        template._observer = self._observer(counters, index)
+
+        callback = self.callback
+        if callback is not None and compile_time is not None:
+            callback('compile', template, compile_time)
+
+        return template
+
+    def _observer(self, counters, index):
+        lock = self._lock
+
+        def observe(template, masks, elapsed):
+            # walks the template again to find the entries taken, out of the timing
+            taken = []
+            for mask, count in Counter(masks).items():
+                def select(block):
+                    entry = block.select(mask)
+                    if entry is not None:
+                        taken.append((index[id(entry)], count))
+
+                    return entry
+
+                for chunk in _chunks(template._blocks, select):
+                    pass
+
+            with lock:
+                counters.renders += len(masks)
+                counters.render_time += elapsed
+                hits = counters.hits
+                for i, count in taken:
+                    hits[i] += count
+
+            callback = self.callback
+            if callback is not None:
+                callback('render', template, elapsed)
+
+        return observe
+
+    def stats(self, template):
+        """
+        Returns the statistics of a template, or None when it is not attached.
+        """
+        with self._lock:
+            counters = self._counters.get(template)
+            return None if counters is None else counters.stats()
+
+    def snapshot(self):
+        """
+        Returns the statistics of the shared keys and of the other attached
+        templates still alive.
+        """
+        with self._lock:
+            result = list(self._shared.values())
+            shared = set(map(id, result))
+            for counters in self._counters.values():
+                if id(counters) not in shared:
+                    shared.add(id(counters))
+                    result.append(counters)
+
+            return [counters.stats() for counters in result]
+
+
+class _Counters:
+    """
+    The mutable statistics of one template, or of the templates sharing a key.
+    The entries are numbered in the order their directives appear in the
+    template.
+    """
+    __slots__ = ['name', 'compiles', 'compile_time', 'renders', 'render_time', 'hits']
+
+    def __init__(self, name, entries):
+        self.name = name
+        self.compiles = 0
+        self.compile_time = None
+        self.renders = 0
+        self.render_time = 0.0
+        self.hits = [0] * entries
+
+    def stats(self):
+        return TemplateStats(self.name, self.compiles, self.compile_time, self.renders, self.render_time,
+                             tuple(self.hits))
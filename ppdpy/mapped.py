@@ -0,0 +1,116 @@
+"""
+Compilation of memory-mapped template files.
+
+The text blocks of a template compiled with `compile_path` are (offset, length)
+spans into a read-only memory map of the file, and their text is only decoded
+when it is rendered. The encoding must be ASCII compatible (like UTF-8), so
+that lines can be split on the newline byte.
+"""
+import mmap
+from functools import partial
+
+from ppdpy.template_compiler import _compile, TextBlock, LINEBREAK
+
+_NEWLINE = b'\n'
+_CR = b'\r'
+
+
+def compile_path(path, encoding='utf-8', dialect=None):
+    """
+    Compiles the template file at `path` without copying its text.
+    """
+    with open(path, 'rb') as f:
+        try:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except ValueError:
+            # empty files can not be mapped
+            return _compile([], partial(_MappedTextBuilder, None), dialect)
+
+    lines = _MappedLines(mapping, encoding)
+    return _compile(lines, partial(_MappedTextBuilder, lines), dialect)
+
+
+class _MappedLines:
+    """
+    Iterates over the decoded lines of a memory map, keeping the span of the
+    last line returned.
+    """
+    __slots__ = ['mapping', 'encoding', 'start', 'end']
+
+    def __init__(self, mapping, encoding):
+        self.mapping = mapping
+        self.encoding = encoding
+        self.start = 0
+        self.end = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = self.end
+        size = len(self.mapping)
+        if start >= size:
+            raise StopIteration
+
+        end = self.mapping.find(_NEWLINE, start)
+        end = size if end < 0 else end + 1
+
+        self.start = start
+        self.end = end
+        return self.mapping[start:end].decode(self.encoding)
+
+
+class _MappedTextBuilder:
+    """
+    Records the span of a text block, instead of its lines.
+    """
+    __slots__ = ['_lines', '_start', '_end']
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._start = None
+        self._end = None
+
+    def add(self, line):
+        if self._start is None:
+            self._start = self._lines.start
+
+        self._end = self._lines.end
+
+    def finish(self):
+        if self._start is None:
+            return TextBlock()
+
+        return MappedTextBlock(self._lines.mapping, self._start, self._end - self._start, self._lines.encoding)
+
+    def __bool__(self):
+        return self._start is not None
+
+
+class MappedTextBlock(TextBlock):
+    """
+    A block of plain text, stored as a span of a memory-mapped file.
+    """
+    __slots__ = ['_mapping', 'offset', 'length', 'encoding']
+
+    def __init__(self, mapping, offset, length, encoding='utf-8'):
+        self._mapping = mapping
+        self.offset = offset
+        self.length = length
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        data = self._mapping[self.offset:self.offset + self.length]
+        text = data.decode(self.encoding)
+
+        if _CR in data:
+            # the same line ending normalization done when compiling lines
+            lines = text.split(LINEBREAK)
+            if lines[-1] == '':
+                lines.pop()
+
+            return LINEBREAK.join([line.rstrip('\r\n') for line in lines]) + LINEBREAK
+
+        return text if text.endswith(LINEBREAK) else text + LINEBREAK
@@ -1,22 +1,48 @@
 class Node:
+    """
+    An expression tree node. Nodes are immutable and keep their hash, computed
+    from the hashes of their children, so hashing never walks the tree and
+    comparing different expressions usually stops at the root.
+    """
+    __slots__ = ['_hash']
+
     def __eq__(self, other):
-        return self._to_tuple() == other._to_tuple()
+        return self is other or (self._hash == other._hash and _equal(self, other))
 
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return self._hash
+
     def _to_tuple(self):
         raise NotImplemented
 
     def eval(self, symbols:set) -> bool:
         raise NotImplemented
 
+    def ids(self) -> set:
+        """
+        Returns the set of identifiers referenced by this node.
+        """
+        raise NotImplemented
+
+    def to_source(self, test) -> str:
+        """
+        Returns a python expression equivalent to this node. The `test`
+        callable receives an identifier and returns the python expression
+        that checks for its presence.
+        """
+        raise NotImplemented
+
 
 class Id(Node):
+    __slots__ = ['id']
     id: str
 
     def __init__(self, id:str):
         self.id = id
+        self._hash = hash(('id', id))
 
     def _to_tuple(self):
         return ('id', self.id)
@@ -24,45 +50,241 @@ class Id(Node):
     def eval(self, symbols:set) -> bool:
         return self.id in symbols
 
+    def ids(self) -> set:
+        return {self.id}
+
+    def to_source(self, test) -> str:
+        return test(self.id)
+
+
+class Const(Node):
+    """
+    A constant, produced when simplifying expressions.
+    """
+    __slots__ = ['value']
+    value: bool
+
+    def __init__(self, value:bool):
+        self.value = value
+        self._hash = hash(('const', value))
+
+    def _to_tuple(self):
+        return ('const', self.value)
+
+    def eval(self, symbols:set) -> bool:
+        return self.value
+
+    def ids(self) -> set:
+        return set()
+
+    def to_source(self, test) -> str:
+        return repr(self.value)
+
 
 class Not(Node):
+    __slots__ = ['n']
     n: Node
 
     def __init__(self, node):
         self.n = node
+        self._hash = hash(('not', node._hash))
 
     def _to_tuple(self):
         return ('not', self.n._to_tuple())
 
     def eval(self, symbols:set) -> bool:
-        return not self.n.eval(symbols)
+        return _eval(self, symbols)
+
+    def ids(self) -> set:
+        return _ids(self)
+
+    def to_source(self, test) -> str:
+        return _source(self, test)
 
 
 class And(Node):
+    __slots__ = ['left', 'right']
     left: Node
     right: Node
 
     def __init__(self, left, right):
         self.left = left
         self.right = right
+        self._hash = hash(('and', left._hash, right._hash))
 
     def _to_tuple(self):
         return ('and', self.left._to_tuple(), self.right._to_tuple())
 
     def eval(self, symbols:set) -> bool:
-        return self.left.eval(symbols) and self.right.eval(symbols)
+        return _eval(self, symbols)
+
+    def ids(self) -> set:
+        return _ids(self)
+
+    def to_source(self, test) -> str:
+        return _source(self, test)
 
 
 class Or(Node):
+    __slots__ = ['left', 'right']
     left: Node
     right: Node
 
     def __init__(self, left, right):
         self.left = left
         self.right = right
+        self._hash = hash(('or', left._hash, right._hash))
 
     def _to_tuple(self):
         return ('or', self.left._to_tuple(), self.right._to_tuple())
 
     def eval(self, symbols:set) -> bool:
-        return self.left.eval(symbols) or self.right.eval(symbols)
+        return _eval(self, symbols)
+
+    def ids(self) -> set:
+        return _ids(self)
+
+    def to_source(self, test) -> str:
+        return _source(self, test)
+
+
+def _equal(a, b) -> bool:
+    """
+    Compares two trees without recursion, skipping the subtrees they share.
+    """
+    pending = [(a, b)]
+    while pending:
+        a, b = pending.pop()
+        if a is b:
+            continue
+
+        if a.__class__ is not b.__class__ or a._hash != b._hash:
+            return False
+
+        if isinstance(a, Id):
+            if a.id != b.id:
+                return False
+
+        elif isinstance(a, Const):
+            if a.value != b.value:
+                return False
+
+        elif isinstance(a, Not):
+            pending.append((a.n, b.n))
+
+        else:
+            pending.append((a.right, b.right))
+            pending.append((a.left, b.left))
+
+    return True
+
+
+# negates the value evaluated before it, in the stack of `_eval`
+_NEGATE = object()
+
+
+def _eval(node, symbols) -> bool:
+    """
+    Evaluates a tree without recursion, short-circuiting like python does.
+    """
+    value = False
+    # nodes to evaluate, _NEGATE, or the (operator, right operand) of the
+    # chains whose left operand is being evaluated
+    pending = [node]
+    while pending:
+        n = pending.pop()
+        if n is _NEGATE:
+            value = not value
+
+        elif isinstance(n, tuple):
+            kind, right = n
+            # the right operand only runs when the left one does not decide
+            if value != (kind is Or):
+                pending.append(right)
+
+        elif isinstance(n, Id):
+            value = n.id in symbols
+
+        elif isinstance(n, Const):
+            value = n.value
+
+        elif isinstance(n, Not):
+            pending.append(_NEGATE)
+            pending.append(n.n)
+
+        else:
+            pending.append((n.__class__, n.right))
+            pending.append(n.left)
+
+    return value
+
+
+def _ids(node) -> set:
+    result = set()
+    pending = [node]
+    while pending:
+        n = pending.pop()
+        if isinstance(n, Id):
+            result.add(n.id)
+
+        elif isinstance(n, Not):
+            pending.append(n.n)
+
+        elif isinstance(n, (And, Or)):
+            pending.append(n.right)
+            pending.append(n.left)
+
+    return result
+
+
+def _source(node, test) -> str:
+    """
+    Builds the python source of a tree without recursion, flattening chains
+    of the same operator into a single expression, e.g. `And(And(a, b), c)`
+    becomes `(a and b and c)`.
+    """
+    results = {}
+    pending = [(node, False)]
+    while pending:
+        n, ready = pending.pop()
+        if isinstance(n, (Id, Const)):
+            results[id(n)] = n.to_source(test)
+
+        elif isinstance(n, Not):
+            if ready:
+                results[id(n)] = '(not ' + results[id(n.n)] + ')'
+
+            else:
+                pending.append((n, True))
+                pending.append((n.n, False))
+
+        else:
+            operands = flatten(n, n.__class__)
+            if ready:
+                operator = ' and ' if isinstance(n, And) else ' or '
+                results[id(n)] = '(' + operator.join(results[id(operand)] for operand in operands) + ')'
+
+            else:
+                pending.append((n, True))
+                pending.extend((operand, False) for operand in operands)
+
+    return results[id(node)]
+
+
+def flatten(node, kind):
+    """
+    Returns the operands of a chain of `kind` nodes (And or Or), from left to
+    right, e.g. `And(And(a, b), c)` yields `[a, b, c]`.
+    """
+    operands = []
+    pending = [node]
+    while pending:
+        n = pending.pop()
+        if isinstance(n, kind):
+            pending.append(n.right)
+            pending.append(n.left)
+
+        else:
+            operands.append(n)
+
+    return operands
@@ -0,0 +1,279 @@
+"""
+Optimization pass over compiled templates.
+
+`optimize` rebuilds a template with its expressions simplified and
+hash-consed: structurally equal expressions become the same node, double
+negations and duplicate terms are removed, the terms of and/or chains are
+put in a canonical order, constant terms are folded, and branches that can
+never (or always) be taken are resolved. Entries with equal expressions
+share a single test, which for larger expressions remembers its last result,
+so each distinct condition is evaluated once per render.
+"""
+from ppdpy.expression_compiler import to_mask_function
+from ppdpy.nodes import Node, Id, Const, Not, And, Or, flatten
+from ppdpy.symbols import SymbolTable
+from ppdpy.template_compiler import Template, TextBlock, IfBlock, IfEntry, ElseEntry
+
+TRUE = Const(True)
+FALSE = Const(False)
+
+# below this many nodes, evaluating an expression costs about the same as
+# looking up a remembered result
+_MEMO_MIN_SIZE = 8
+
+
+class Simplifier:
+    """
+    Simplifies expressions, returning the same node for structurally equal
+    expressions (hash-consing). The identifiers in `true` and `false` are
+    taken as constants.
+    """
+    def __init__(self, true=(), false=()):
+        self._nodes = {('const', True): TRUE, ('const', False): FALSE}
+        # symbols with a known value, replaced by constants
+        for name in true:
+            self._nodes[('id', name)] = TRUE
+
+        for name in false:
+            self._nodes[('id', name)] = FALSE
+
+        # creation order of the nodes, which puts the operands of and/or
+        # chains in a canonical order
+        self._order = {id(TRUE): 0, id(FALSE): 1}
+
+    def simplify(self, node:Node) -> Node:
+        results = {}
+        pending = [(node, False)]
+        while pending:
+            n, ready = pending.pop()
+            if isinstance(n, Id):
+                name = n.id
+                results[id(n)] = self._intern(('id', name), lambda: Id(name))
+
+            elif isinstance(n, Const):
+                results[id(n)] = TRUE if n.value else FALSE
+
+            elif isinstance(n, Not):
+                if ready:
+                    results[id(n)] = self.negate(results[id(n.n)])
+
+                else:
+                    pending.append((n, True))
+                    pending.append((n.n, False))
+
+            else:
+                kind = And if isinstance(n, And) else Or
+                operands = flatten(n, kind)
+                if ready:
+                    results[id(n)] = self.combine(kind, [results[id(operand)] for operand in operands])
+
+                else:
+                    # the operands are simplified from left to right, which
+                    # keeps the canonical order of the nodes they create
+                    pending.append((n, True))
+                    pending.extend((operand, False) for operand in reversed(operands))
+
+        return results[id(node)]
+
+    def negate(self, node:Node) -> Node:
+        if isinstance(node, Not):
+            # not not a
+            return node.n
+
+        elif isinstance(node, Const):
+            return FALSE if node.value else TRUE
+
+        return self._intern(('not', id(node)), lambda: Not(node))
+
+    def combine(self, kind, operands) -> Node:
+        """
+        Combines simplified operands with the `kind` operator (And or Or).
+        """
+        # the constant that decides the whole chain, and the one that is ignored
+        absorbing, identity = (FALSE, TRUE) if kind is And else (TRUE, FALSE)
+
+        result = []
+        seen = set()
+        for operand in _flatten_all(operands, kind):
+            if operand is absorbing:
+                return absorbing
+
+            elif operand is identity or id(operand) in seen:
+                continue
+
+            seen.add(id(operand))
+            result.append(operand)
+
+        for operand in result:
+            if isinstance(operand, Not) and id(operand.n) in seen:
+                # a and not a, a or not a
+                return absorbing
+
+        if not result:
+            return identity
+
+        order = self._order
+        result.sort(key=lambda operand: order[id(operand)])
+        return self._balance(kind, result, 0, len(result))
+
+    def _balance(self, kind, operands, start, end):
+        if end - start == 1:
+            return operands[start]
+
+        middle = (start + end) // 2
+        left = self._balance(kind, operands, start, middle)
+        right = self._balance(kind, operands, middle, end)
+        return self._intern((kind.__name__, id(left), id(right)), lambda: kind(left, right))
+
+    def _intern(self, key, create):
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._nodes[key] = create()
+            self._order[id(node)] = len(self._order)
+
+        return node
+
+
+def _flatten_all(operands, kind):
+    for operand in operands:
+        if isinstance(operand, kind):
+            yield from flatten(operand, kind)
+
+        else:
+            yield operand
+
+
+def optimize(template:Template) -> Template:
+    """
+    Returns an optimized copy of the template.
+    """
+    return rewrite(template, Simplifier().simplify)
+
+
+def specialize(template:Template, true=(), false=()) -> Template:
+    """
+    Returns an optimized copy of the template for renders in which the
+    symbols in `true` are always given and the ones in `false` never are.
+    """
+    both = set(true) & set(false)
+    if both:
+        raise ValueError('symbols both true and false: ' + ', '.join(sorted(both)))
+
+    return rewrite(template, Simplifier(true, false).simplify)
+
+
+def rewrite(template:Template, transform) -> Template:
+    """
+    Returns a copy of the template, of the same class, with the expressions
+    replaced by `transform(expression)`, which must return simplified,
+    hash-consed nodes. Entries whose expression becomes false are removed, an entry
+    whose expression becomes true turns into an #else, and adjacent text
+    blocks are merged.
+    """
+    return rewrite_entries(template,
+                           lambda entry: transform(entry._expression) if isinstance(entry, IfEntry) else TRUE)
+
+
+def rewrite_entries(template:Template, transform) -> Template:
+    """
+    The same as `rewrite`, but `transform(entry)` receives each #if, #elif
+    and #else entry and returns its new expression, TRUE for an #else.
+    """
+    symbol_table = SymbolTable()
+    tests = {}
+    replacements = {}
+
+    # if blocks are listed before the ones nested in them, so going through
+    # the list backwards rewrites the nested blocks first
+    if_blocks = []
+    pending = [template._blocks]
+    while pending:
+        for block in pending.pop():
+            if isinstance(block, IfBlock):
+                if_blocks.append(block)
+                pending.extend(entry._blocks for entry in block._if_entries)
+
+    for block in reversed(if_blocks):
+        entries = []
+        for entry in block._if_entries:
+            blocks = _replace(entry._blocks, replacements)
+            expression = transform(entry)
+
+            if expression is FALSE:
+                continue
+
+            elif expression is TRUE:
+                entries.append(ElseEntry(blocks))
+                break
+
+            test = tests.get(id(expression))
+            if test is None:
+                test = tests[id(expression)] = _test(expression, symbol_table)
+
+            entries.append(IfEntry(expression, blocks, symbol_table, test))
+
+        if not entries:
+            replacements[id(block)] = []
+
+        elif isinstance(entries[0], ElseEntry):
+            # always taken
+            replacements[id(block)] = entries[0]._blocks
+
+        else:
+            replacements[id(block)] = [IfBlock(entries)]
+
+    return template.__class__(_replace(template._blocks, replacements), symbol_table)
+
+
+def _replace(blocks, replacements):
+    result = []
+    for block in blocks:
+        for b in replacements.get(id(block), [block]) if isinstance(block, IfBlock) else [block]:
+            if isinstance(b, IfBlock):
+                result.append(b)
+
+            elif b.text:
+                if result and isinstance(result[-1], TextBlock):
+                    result[-1] = TextBlock(result[-1].text + b.text)
+
+                else:
+                    result.append(b)
+
+    return result
+
+
+def _test(expression, symbol_table):
+    function = to_mask_function(expression, symbol_table)
+    if _size(expression) < _MEMO_MIN_SIZE:
+        return function
+
+    # (mask, result) of the last evaluation, replaced as a whole so that
+    # concurrent renders never see a mismatched pair
+    last = [(None, None)]
+
+    def test(mask):
+        memo = last[0]
+        if memo[0] == mask:
+            return memo[1]
+
+        result = function(mask)
+        last[0] = (mask, result)
+        return result
+
+    return test
+
+
+def _size(node):
+    size = 0
+    pending = [node]
+    while pending:
+        n = pending.pop()
+        size += 1
+        if isinstance(n, Not):
+            pending.append(n.n)
+
+        elif isinstance(n, (And, Or)):
+            pending.append(n.left)
+            pending.append(n.right)
+
+    return size
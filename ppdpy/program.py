@@ -0,0 +1,175 @@
+"""
+Flat, array-backed form of expression trees.
+
+A program is a sequence of (opcode, argument) pairs stored in an `array`,
+plus the tuple of identifiers it tests. It runs on a single boolean register
+against the integer masks render works with: `TEST` loads whether the bit of
+an identifier is set, `NOT` negates the register,
+and the `and`/`or` operators become jumps over their right operand when the
+left one already decides the result, so evaluation short-circuits like the
+tree does. Programs keep the exact shape of the tree they come from, take a
+fraction of its memory and are built, run and turned back into trees without
+recursion.
+
+    >>> program = Program.from_node(And(Id('a'), Not(Id('b'))))
+    >>> list(program.code), program.ids
+    ([0, 0, 3, 4, 0, 1, 2, 0], ('a', 'b'))
+"""
+from array import array
+
+from ppdpy.nodes import Node, Id, Const, Not, And, Or
+
+TEST = 0
+CONST = 1
+NOT = 2
+JUMP_IF_FALSE = 3
+JUMP_IF_TRUE = 4
+
+# work items of the program builder
+_NODE = 0
+_OP = 1
+_JUMP = 2
+_LABEL = 3
+
+
+class Program:
+    """
+    A compiled expression. `code` holds pairs of opcode and argument: the
+    index in `ids` for TEST, 0 or 1 for CONST, and the position of the target
+    pair for the jumps.
+    """
+    __slots__ = ['code', 'ids']
+
+    def __init__(self, code, ids):
+        self.code = code if isinstance(code, array) else array('i', code)
+        self.ids = tuple(ids)
+
+    @classmethod
+    def from_node(cls, node:Node) -> 'Program':
+        code = array('i')
+        ids = []
+        indexes = {}
+        pending = [(_NODE, node)]
+
+        while pending:
+            kind, item = pending.pop()
+            if kind == _OP:
+                code.extend((item, 0))
+
+            elif kind == _JUMP:
+                # the target is patched when its label is reached
+                item.append(len(code) + 1)
+                code.extend((JUMP_IF_FALSE if item[0] is And else JUMP_IF_TRUE, 0))
+
+            elif kind == _LABEL:
+                code[item[1]] = len(code) // 2
+
+            elif isinstance(item, Id):
+                index = indexes.get(item.id)
+                if index is None:
+                    index = indexes[item.id] = len(ids)
+                    ids.append(item.id)
+
+                code.extend((TEST, index))
+
+            elif isinstance(item, Const):
+                code.extend((CONST, 1 if item.value else 0))
+
+            elif isinstance(item, Not):
+                pending.append((_OP, NOT))
+                pending.append((_NODE, item.n))
+
+            else:
+                # left, jump to the end when it decides, right, end
+                jump = [item.__class__]
+                pending.append((_LABEL, jump))
+                pending.append((_NODE, item.right))
+                pending.append((_JUMP, jump))
+                pending.append((_NODE, item.left))
+
+        return cls(code, ids)
+
+    def mask_function(self, symbol_table):
+        """
+        Returns a function that runs the program on an integer mask of
+        symbols built by `symbol_table` (see `ppdpy.symbols.SymbolTable`).
+        """
+        code = self.code
+        bits = tuple(symbol_table.intern(id) for id in self.ids)
+        end = len(code)
+
+        def test(mask):
+            pc = 0
+            value = False
+
+            while pc < end:
+                op = code[pc]
+                arg = code[pc + 1]
+                pc += 2
+
+                if op == TEST:
+                    value = mask & bits[arg] != 0
+
+                elif op == NOT:
+                    value = not value
+
+                elif op == JUMP_IF_FALSE:
+                    if not value:
+                        pc = arg * 2
+
+                elif op == JUMP_IF_TRUE:
+                    if value:
+                        pc = arg * 2
+
+                else:
+                    value = arg != 0
+
+            return value
+
+        return test
+
+    def to_node(self) -> Node:
+        """
+        Rebuilds the expression tree the program was compiled from.
+        """
+        code = self.code
+        ids = self.ids
+        operands = []
+        # (operator, target) of the jumps whose right operand is being read,
+        # innermost last
+        operators = []
+
+        for i in range(0, len(code) + 1, 2):
+            position = i // 2
+            while operators and operators[-1][1] == position:
+                kind = operators.pop()[0]
+                right = operands.pop()
+                operands.append(kind(operands.pop(), right))
+
+            if i == len(code):
+                break
+
+            op = code[i]
+            arg = code[i + 1]
+            if op == TEST:
+                operands.append(Id(ids[arg]))
+
+            elif op == CONST:
+                operands.append(Const(arg != 0))
+
+            elif op == NOT:
+                operands.append(Not(operands.pop()))
+
+            else:
+                operators.append((And if op == JUMP_IF_FALSE else Or, arg))
+
+        return operands.pop()
+
+    def __eq__(self, other):
+        return self.code == other.code and self.ids == other.ids
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.code.tobytes(), self.ids))
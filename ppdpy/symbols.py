@@ -0,0 +1,67 @@
+class SymbolTable:
+    """
+    Interns the identifiers referenced by a template, assigning a bit position
+    to each one, so the symbols of a render call can be turned into a single
+    integer mask.
+    """
+    def __init__(self, ids=()):
+        self._bits = {}
+        self._items = []
+
+        for id in ids:
+            self.intern(id)
+
+    def intern(self, id:str) -> int:
+        """
+        Returns the bit assigned to the identifier, assigning a new one if needed.
+        """
+        bit = self._bits.get(id)
+        if bit is None:
+            bit = 1 << len(self._items)
+            self._bits[id] = bit
+            self._items.append((id, bit))
+
+        return bit
+
+    def bit(self, id:str) -> int:
+        """
+        Returns the bit assigned to the identifier, or 0 if it is unknown.
+        """
+        return self._bits.get(id, 0)
+
+    def mask(self, symbols) -> int:
+        """
+        Converts the symbols given to a render call to a mask. Sets, frozensets
+        and dicts (by their keys) are used as they are; other iterables are
+        converted to a set first.
+        """
+        if not isinstance(symbols, (set, frozenset, dict)):
+            symbols = set(symbols)
+
+        mask = 0
+        if len(symbols) < len(self._items):
+            bits = self._bits
+            for s in symbols:
+                mask |= bits.get(s, 0)
+
+        else:
+            for id, bit in self._items:
+                if id in symbols:
+                    mask |= bit
+
+        return mask
+
+    def symbols(self, mask:int) -> set:
+        """
+        Converts a mask back to the set of identifiers it represents.
+        """
+        return {id for id, bit in self._items if mask & bit}
+
+    def __contains__(self, id):
+        return id in self._bits
+
+    def __iter__(self):
+        return (id for id, bit in self._items)
+
+    def __len__(self):
+        return len(self._items)
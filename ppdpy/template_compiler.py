@@ -1,110 +1,240 @@
-from ppdpy.expression_compiler import compile as compile_expression
+import struct
+import sys
+from time import perf_counter
+
+from ppdpy.dialect import Dialect, DEFAULT_DIALECT
+from ppdpy.expression_compiler import compile as compile_expression, to_mask_function
 from ppdpy.exceptions import DirectiveSyntaxError
+from ppdpy.symbols import SymbolTable
+from ppdpy.utility import LRUCache
 
 LINEBREAK = '\n'
 
-# Preprocessor Directive Sufix
-PPD_PREFIX = '#'
+_POINTER_SIZE = struct.calcsize('P')
+
+# Preprocessor Directive Sufix, kept for reference: the directives are read
+# from the dialect given to compile, or the default one
+PPD_PREFIX = DEFAULT_DIALECT.prefix
 
-_PPD_IF = ''
-_PPD_ELIF = ''
-_PPD_ELSE = ''
-_PPD_ENDIF = ''
+# replaced as a whole by set_directive_prefixes, never modified
+_default_dialect = DEFAULT_DIALECT
 
 
 def set_directive_prefixes(prefix):
-    global PPD_PREFIX, _PPD_IF, _PPD_ELIF, _PPD_ELSE, _PPD_ENDIF
+    global PPD_PREFIX, _default_dialect
+    _default_dialect = Dialect(prefix)
     PPD_PREFIX = prefix
 
-    _PPD_IF = PPD_PREFIX + 'if'
-    _PPD_ELIF = PPD_PREFIX + 'elif'
-    _PPD_ELSE = PPD_PREFIX + 'else'
-    _PPD_ENDIF = PPD_PREFIX + 'endif'
 
+def default_dialect():
+    """
+    Returns the dialect used when none is given to compile.
+    """
+    return _default_dialect
 
-set_directive_prefixes(PPD_PREFIX)
 
+def compile(lines, dialect=None):
+    return _compile(lines, _TextBuilder, dialect)
 
-def compile(lines):
-    iterlines = iter(lines)
 
-    result = _parse(iterlines)
-    return Template(result)
+def _compile(lines, text_builder, dialect=None):
+    parser = _Parser(text_builder, dialect)
+    for line in lines:
+        parser.feed(line)
 
+    return parser.finish()
 
-def _parse(lines):
-    result, remainder = _parse_until(lines, tuple())
-    return result
 
+class _Parser:
+    """
+    Builds a template from lines fed one at a time. Open conditionals are kept
+    in an explicit stack of frames, so any nesting depth is parsed in linear
+    time without recursion.
+    """
+    __slots__ = ['_symbol_table', '_text_builder', '_dialect', '_stack', '_expressions', '_tests']
+
+    def __init__(self, text_builder, dialect=None):
+        self._symbol_table = SymbolTable()
+        # the same conditions repeat across #if/#elif lines, so their trees,
+        # and the tests generated for them, are shared within the template
+        self._expressions = {}
+        self._tests = {}
+        self._dialect = _default_dialect if dialect is None else dialect
+        self._text_builder = text_builder
+        # the root frame holds the template blocks, the others one open #if each
+        self._stack = [_Frame(text_builder(), None)]
+
+    def feed(self, line):
+        line = line.rstrip('\r\n')
+        l = line.strip()
+        frame = self._stack[-1]
+        dialect = self._dialect
+
+        if not l.startswith(dialect.prefix):
+            frame.text.add(line)
+            return
 
-def _parse_until(lines, end_directives):
-    result = []
-    current_block = TextBlock()
+        directive = _fetch_directive(l, dialect)
+        in_if = frame.entries is not None
 
-    try:
-        while True:
-            line = next(lines).rstrip('\r\n')
-            l = line.strip()
+        if directive == dialect.if_directive:
+            expression = self._expression(l)
+            if frame.text:
+                frame.blocks.append(frame.text.finish())
+                frame.text = self._text_builder()
 
-            if l.startswith(PPD_PREFIX):
-                directive = _fetch_directive(l)
-                if directive in end_directives:
-                    result.append(current_block)
-                    return result, l
+            self._stack.append(_Frame(self._text_builder(), expression))
 
-                elif directive == _PPD_IF:
-                    if current_block.text:
-                        result.append(current_block)
-                        current_block = TextBlock()
+        elif directive == dialect.elif_directive and in_if and not frame.in_else:
+            self._end_entry(frame)
+            frame.expression = self._expression(l)
 
-                    if_entries = list(_parse_if_entries(l, lines))
-                    result.append(IfBlock(if_entries))
+        elif directive == dialect.else_directive and in_if and not frame.in_else:
+            self._end_entry(frame)
+            frame.in_else = True
 
-                else:
-                    raise DirectiveSyntaxError('unexpected directive ' + directive)
+        elif directive == dialect.endif_directive and in_if:
+            self._end_entry(frame)
+            self._stack.pop()
+            self._stack[-1].blocks.append(IfBlock(frame.entries))
 
-            else:
-                current_block.add_text(line)
+        else:
+            raise DirectiveSyntaxError('unexpected directive ' + directive)
 
-    except StopIteration:
-        if end_directives:
+    def finish(self):
+        if len(self._stack) > 1:
             raise DirectiveSyntaxError('missing end directive')
 
+        frame = self._stack[0]
+        frame.blocks.append(frame.text.finish())
+        return Template(frame.blocks, self._symbol_table)
+
+    def _expression(self, line):
+        text = _fetch_expression(line)
+        expression = self._expressions.get(text)
+        if expression is None:
+            expression = self._expressions[text] = compile_expression(text)
+
+        return expression
+
+    def _end_entry(self, frame):
+        frame.blocks.append(frame.text.finish())
+
+        if frame.in_else:
+            frame.entries.append(ElseEntry(frame.blocks))
+
         else:
-            result.append(current_block)
-            return result, None
+            frame.entries.append(IfEntry(frame.expression, frame.blocks, self._symbol_table, tests=self._tests))
 
+        frame.blocks = []
+        frame.text = self._text_builder()
 
-def _parse_if_entries(last_line, lines):
-    while True:
-        if_expression = compile_expression(_fetch_expression(last_line))
-        if_blocks, last_line = _parse_until(lines, (_PPD_ELIF, _PPD_ELSE, _PPD_ENDIF))
-        yield IfEntry(if_expression, if_blocks)
 
-        next_directive = _fetch_directive(last_line)
-        if next_directive == _PPD_ENDIF:
-            return
+class _Frame:
+    """
+    The blocks being parsed at one nesting level.
+    """
+    __slots__ = ['blocks', 'text', 'expression', 'entries', 'in_else']
 
-        elif next_directive == _PPD_ELSE:
-            else_blocks, last_line = _parse_until(lines, (_PPD_ENDIF, ))
-            yield ElseEntry(else_blocks)
-            return
+    def __init__(self, text, expression):
+        self.blocks = []
+        self.text = text
+        self.expression = expression
+        self.entries = None if expression is None else []
+        self.in_else = False
 
-        elif next_directive != _PPD_ELIF:
-            raise DirectiveSyntaxError()
 
+class _TextBuilder:
+    """
+    Collects the lines of a text block, joining them once when it ends.
+    """
+    __slots__ = ['_lines']
+
+    def __init__(self):
+        self._lines = []
+
+    def add(self, line):
+        self._lines.append(line)
+
+    def finish(self):
+        return TextBlock(LINEBREAK.join(self._lines) + LINEBREAK if self._lines else '')
+
+    def __bool__(self):
+        return bool(self._lines)
+
+
+def preprocess(lines, symbols, out, dialect=None):
+    """
+    Evaluates the directives while reading the lines, writing only the active
+    lines to the file-like object `out`. No template is built, so the memory
+    used depends only on the nesting depth of the conditionals. Output written
+    before a syntax error is found is not retracted.
+    """
+    if not isinstance(symbols, (set, frozenset, dict)):
+        symbols = set(symbols)
+
+    if dialect is None:
+        dialect = _default_dialect
+
+    write = out.write
+    first = True
+    active = True
+    # one frame per open #if: [enclosing block is active, a branch was taken, inside #else]
+    stack = []
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        l = line.strip()
+
+        if l.startswith(dialect.prefix):
+            directive = _fetch_directive(l, dialect)
+            if directive == dialect.if_directive:
+                expression = compile_expression(_fetch_expression(l))
+                taken = active and expression.eval(symbols)
+                stack.append([active, taken, False])
+                active = taken
+
+            elif directive == dialect.elif_directive and stack and not stack[-1][2]:
+                frame = stack[-1]
+                expression = compile_expression(_fetch_expression(l))
+                active = frame[0] and not frame[1] and expression.eval(symbols)
+                frame[1] = frame[1] or active
+
+            elif directive == dialect.else_directive and stack and not stack[-1][2]:
+                frame = stack[-1]
+                frame[2] = True
+                active = frame[0] and not frame[1]
+
+            elif directive == dialect.endif_directive and stack:
+                active = stack.pop()[0]
+
+            else:
+                raise DirectiveSyntaxError('unexpected directive ' + directive)
+
+        elif active:
+            if first:
+                first = False
+
+            else:
+                write(LINEBREAK)
+
+            write(line)
+
+    if stack:
+        raise DirectiveSyntaxError('missing end directive')
 
-def _fetch_directive(line):
+
+def _fetch_directive(line, dialect):
     ls = line.strip().lower()
     try:
         return ls.split(' ')[0]
 
     except IndexError:
-        if ls == _PPD_ELSE:
-            return _PPD_ELSE
+        if ls == dialect.else_directive:
+            return dialect.else_directive
 
-        elif ls == _PPD_ENDIF:
-            return _PPD_ENDIF
+        elif ls == dialect.endif_directive:
+            return dialect.endif_directive
 
         raise DirectiveSyntaxError()
 
@@ -121,42 +251,341 @@ class Template:
     """
     A compiled text
     """
-    def __init__(self, blocks=[]):
+    def __init__(self, blocks=[], symbol_table=None):
         self._blocks = blocks
+        self._symbols = SymbolTable() if symbol_table is None else symbol_table
+        self._cache = None
+        self._variants = None
+        self.referenced = frozenset(_referenced_symbols(blocks))
+        # the branches removed by `constrain`
+        self.pruned = ()
+        # called with the template, the masks rendered and the time taken by
+        # every render, iter_render and render_many (see ppdpy.instrumentation)
+        self._observer = None
 
     def render(self, symbols):
-        if isinstance(symbols, dict):
-            ss = set(symbols.keys())
+        mask = self._symbols.mask(symbols)
+        observer = self._observer
+        if observer is None:
+            return self._output(mask)
+
+        started = perf_counter()
+        result = self._output(mask)
+        observer(self, (mask,), perf_counter() - started)
+        return result
+
+    def _output(self, mask):
+        if self._variants is not None:
+            return self._variants[mask]
+
+        if self._cache is None:
+            return self._render(mask)
+
+        # the mask only holds the symbols that the expressions mention,
+        # which are the only ones the output depends on
+        result = self._cache.get(mask)
+        if result is None:
+            result = self._render(mask)
+            self._cache.put(mask, result)
+
+        return result
+
+    def specialize(self, true=(), false=()):
+        """
+        Returns a smaller template for renders in which the symbols in `true`
+        are always given and the ones in `false` never are, with the branches
+        they decide resolved and the remaining expressions simplified.
+        """
+        from ppdpy.optimizer import specialize
+        return specialize(self, true, false)
+
+    def constrain(self, constraints):
+        """
+        Returns a smaller template for renders whose symbols satisfy the
+        `constraints` (a `ppdpy.Constraints`), without the branches they make
+        unreachable, which are listed in its `pruned` attribute.
+        """
+        from ppdpy.constraints import prune
+        return prune(self, constraints)
+
+    def enable_cache(self, maxsize=128):
+        """
+        Caches up to `maxsize` rendered outputs, keyed by the referenced symbols.
+        """
+        self._cache = LRUCache(maxsize)
+
+    def disable_cache(self):
+        self._cache = None
+
+    def cache_info(self):
+        """
+        Returns the render cache statistics, or None when caching is disabled.
+        """
+        return None if self._cache is None else self._cache.info()
+
+    def precompute_variants(self, max_symbols=8, max_bytes=1 << 20):
+        """
+        Renders the template for every assignment of the referenced symbols,
+        so that later renders are a table lookup. Returns False, and keeps the
+        normal rendering, when the template references more than `max_symbols`
+        symbols or the distinct outputs take more than `max_bytes`.
+        """
+        n = len(self._symbols)
+        if n > max_symbols:
+            return False
+
+        distinct = {}
+        table = []
+        size = sys.getsizeof(table) + (1 << n) * _POINTER_SIZE
+
+        # the table is indexed by the same masks that render computes
+        for mask in range(1 << n):
+            result = self._render(mask)
+            if result not in distinct:
+                distinct[result] = result
+                size += sys.getsizeof(result)
+                if size > max_bytes:
+                    return False
+
+            table.append(distinct[result])
+
+        self._variants = table
+        return True
 
-        else:
-            ss = set(symbols)
+    def variant_count(self):
+        """
+        Returns the number of distinct precomputed outputs, or None when there
+        is no variant table.
+        """
+        return None if self._variants is None else len(set(map(id, self._variants)))
+
+    def _render(self, mask):
+        parts = []
+        append = parts.append
+        # the blocks being rendered at each nesting level
+        pending = [iter(self._blocks)]
+
+        while pending:
+            for block in pending[-1]:
+                if block.__class__ is not IfBlock:
+                    append(block.text)
+                    continue
+
+                entry = block.select(mask)
+                if entry is not None:
+                    pending.append(iter(entry._blocks))
+                    break
 
-        return ''.join([block.apply(ss) for block in self._blocks])[:-len(LINEBREAK)]
+            else:
+                pending.pop()
+
+        return ''.join(parts)[:-len(LINEBREAK)]
+
+    def iter_render(self, symbols):
+        """
+        Renders the template as a sequence of text chunks, yielded as the
+        conditionals are resolved, without building the whole output.
+        """
+        mask = self._symbols.mask(symbols)
+        chunks = self._iter_output(mask)
+        observer = self._observer
+        return chunks if observer is None else _observed(self, observer, mask, chunks)
+
+    def _iter_output(self, mask):
+        if self._variants is not None:
+            result = self._variants[mask]
+            if result:
+                yield result
 
+            return
 
-class TextBlock:
+        chunks = self._iter_apply(mask)
+        # holds back one chunk, so the final linebreak can be dropped from it
+        last = next(chunks, '')
+        for chunk in chunks:
+            yield last
+            last = chunk
+
+        last = last[:-len(LINEBREAK)]
+        if last:
+            yield last
+
+    def render_to(self, fp, symbols):
+        """
+        Renders the template, writing the text chunks to a file-like object.
+        """
+        write = fp.write
+        for chunk in self.iter_render(symbols):
+            write(chunk)
+
+    async def arender_to(self, writer, symbols, encoding='utf-8', buffer_size=1 << 16):
+        """
+        Renders the template to an asyncio StreamWriter, encoding the text and
+        waiting on `drain` every `buffer_size` bytes.
+        """
+        from ppdpy.aio import arender_to
+        await arender_to(self, writer, symbols, encoding, buffer_size)
+
+    def _iter_apply(self, mask):
+        return _chunks(self._blocks, lambda block: block.select(mask))
+
+    def render_many(self, symbol_sets):
+        """
+        Renders the template for each of the given symbol sets, returning the
+        results in the same order. Inputs that take the same branches share a
+        single rendered output, which is built only once.
+        """
+        observer = self._observer
+        if observer is None:
+            return self._render_many(map(self._symbols.mask, symbol_sets))
+
+        started = perf_counter()
+        masks = [self._symbols.mask(symbols) for symbols in symbol_sets]
+        results = self._render_many(masks)
+        observer(self, masks, perf_counter() - started)
+        return results
+
+    def _render_many(self, masks):
+        by_mask = {}
+        by_decisions = {}
+        results = []
+
+        for mask in masks:
+            result = by_mask.get(mask)
+
+            if result is None:
+                decisions = self._decide(mask)
+                result = by_decisions.get(decisions)
+                if result is None:
+                    result = self._build(decisions)
+                    by_decisions[decisions] = result
+
+                by_mask[mask] = result
+
+            results.append(result)
+
+        return results
+
+    def _decide(self, mask):
+        """
+        Returns the decision vector for a mask: the index of the entry taken
+        by each if block reached, in rendering order.
+        """
+        decisions = []
+
+        def select(block):
+            for i, entry in enumerate(block._if_entries):
+                if entry.eval(mask):
+                    decisions.append(i)
+                    return entry
+
+            decisions.append(len(block._if_entries))
+            return None
+
+        for chunk in _chunks(self._blocks, select):
+            pass
+
+        return tuple(decisions)
+
+    def _build(self, decisions):
+        """
+        Renders the text selected by a decision vector.
+        """
+        it = iter(decisions)
+
+        def select(block):
+            i = next(it)
+            return block._if_entries[i] if i < len(block._if_entries) else None
+
+        return ''.join(_chunks(self._blocks, select))[:-len(LINEBREAK)]
+
+
+def _observed(template, observer, mask, chunks):
     """
-    A block of plain text.
+    Yields the chunks of an iter_render, reporting it to the observer with
+    the time spent producing them once they are exhausted.
     """
-    def __init__(self):
-        self.text = ''
-        self.lines = 0
+    elapsed = 0.0
+    started = perf_counter()
+    for chunk in chunks:
+        elapsed += perf_counter() - started
+        yield chunk
+        started = perf_counter()
 
-    def add_text(self, more):
-        self.text += more + LINEBREAK
-        # if self.lines == 0:
-        #     self.text += more
-        #     self.lines += 1
+    observer(template, (mask,), elapsed + perf_counter() - started)
 
-        # else:
-        #     self.text += LINEBREAK + more
-        #     self.lines += 1
 
-    def eval(self, symbols):
-        return True
+def _chunks(blocks, select):
+    """
+    Yields the non-empty texts of the blocks, descending into the entry that
+    `select` returns for each if block (None for no entry).
+    """
+    pending = [iter(blocks)]
+
+    while pending:
+        for block in pending[-1]:
+            if block.__class__ is not IfBlock:
+                text = block.text
+                if text:
+                    yield text
+
+                continue
+
+            entry = select(block)
+            if entry is not None:
+                pending.append(iter(entry._blocks))
+                break
+
+        else:
+            pending.pop()
+
+
+def _entries(blocks):
+    """
+    Yields the entries of the if blocks in the order their directives appear.
+    """
+    # holds iterators over blocks, and over the entries of an if block
+    pending = [iter(blocks)]
+
+    while pending:
+        for item in pending[-1]:
+            if item.__class__ is IfBlock:
+                pending.append(iter(item._if_entries))
+                break
+
+            if not isinstance(item, TextBlock):
+                yield item
+                pending.append(iter(item._blocks))
+                break
 
-    def apply(self, symbols):
-        return self.text
+        else:
+            pending.pop()
+
+
+def _referenced_symbols(blocks):
+    result = set()
+    pending = list(blocks)
+
+    while pending:
+        block = pending.pop()
+        if isinstance(block, IfBlock):
+            for entry in block._if_entries:
+                if isinstance(entry, IfEntry):
+                    result |= entry._expression.ids()
+
+                pending.extend(entry._blocks)
+
+    return result
+
+
+class TextBlock:
+    """
+    A block of plain text.
+    """
+    __slots__ = ['text']
+
+    def __init__(self, text=''):
+        self.text = text
 
 
 class IfBlock:
@@ -170,16 +599,21 @@ class IfBlock:
         ...
         #endif
     """
+    __slots__ = ['_if_entries']
+
     def __init__(self, if_entries):
         self._if_entries = if_entries
 
-    def apply(self, symbols):
+    def select(self, mask):
+        """
+        Returns the first entry whose expression holds for the mask, or None.
+        """
         for entry in self._if_entries:
-            if entry.eval(symbols):
-                return entry.apply(symbols)
+            if entry.eval(mask):
+                return entry
 
         # none of the blocks applied
-        return ''
+        return None
 
 
 class IfEntry:
@@ -188,25 +622,45 @@ class IfEntry:
     When the expression evaluates to true, then the text is yielded,
     otherwise an empty string is yielded.
     """
-    def __init__(self, expression, blocks):
+    __slots__ = ['_expression', '_symbols', '_test', '_tests', '_blocks']
+
+    def __init__(self, expression, blocks, symbol_table, test=None, tests=None):
         self._expression = expression
+        self._symbols = symbol_table
+        for id in expression.ids():
+            symbol_table.intern(id)
+
+        # the test function is generated on the first evaluation, keeping
+        # code generation out of the compile time, and shared through the
+        # `tests` dict with the other entries of the template
+        self._test = test
+        self._tests = tests
         self._blocks = blocks
 
-    def eval(self, symbols):
-        return self._expression.eval(symbols)
+    def eval(self, mask):
+        test = self._test
+        if test is None:
+            test = self.test()
+
+        return test(mask)
+
+    def test(self):
+        """
+        Returns the function that evaluates the expression for a mask.
+        """
+        if self._test is None:
+            self._test = to_mask_function(self._expression, self._symbols, self._tests)
 
-    def apply(self, symbols):
-        return ''.join([block.apply(symbols) for block in self._blocks])
+        return self._test
 
 
 class ElseEntry:
     """
     """
+    __slots__ = ['_blocks']
+
     def __init__(self, blocks):
         self._blocks = blocks
 
-    def eval(self, symbols):
+    def eval(self, mask):
         return True
-
-    def apply(self, symbols):
-        return ''.join([block.apply(symbols) for block in self._blocks])
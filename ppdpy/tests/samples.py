@@ -0,0 +1,91 @@
+"""
+Sample templates shared by the tests that compare alternative compile and
+render strategies against the plain tree-walking renderer.
+"""
+from itertools import combinations
+
+
+SQL = """select channel.id, channel.name, membership.joined_at
+
+#if select_unread_count
+    ,(select coalesce(count(*), 0) from messages m
+      where m.channel_id = channel.id
+        and m.sender_id != chat_user.id
+        and (last_read.id IS NULL OR m.sent_at > last_read.sent_at)
+    ) as unread_count
+#endif
+
+from channel
+
+    inner join membership
+    on membership.channel_id = channel.id
+
+#if select_unread_count
+    left join message last_read
+    on last_read.id = membership.last_read_id
+    and last_read.channel_id = channel.id
+#endif
+
+where chat_user.id = %(user_id)s
+
+#if filter_by_status
+    and channel.status = %(status_filter)s
+#endif
+
+order by
+#if order_by_join_date
+    membership.joined_at
+#elif order_by_readcount
+    4
+#else
+    channel.name
+#endif
+
+#if sort_descending
+    DESC
+#else
+    ASC
+#endif
+"""
+
+NESTED = """
+line 1
+#if a and (b or not c)
+line 2
+    #if c
+line 3
+    #elif not b
+    #else
+line 4
+        #if a and b and c
+line 5
+        #endif
+    #endif
+#elif b or c
+line 6
+#endif
+#if not a
+#endif
+line 7"""
+
+EMPTY = ""
+
+PLAIN = """foobar
+"""
+
+TEMPLATES = [SQL, NESTED, EMPTY, PLAIN]
+
+SYMBOLS = [
+    'a', 'b', 'c',
+    'select_unread_count', 'filter_by_status', 'order_by_join_date',
+    'order_by_readcount', 'sort_descending',
+]
+
+
+def symbol_sets(ids=SYMBOLS):
+    """
+    Yields every subset of the given symbols.
+    """
+    for n in range(len(ids) + 1):
+        for symbols in combinations(ids, n):
+            yield set(symbols)
@@ -0,0 +1,94 @@
+import asyncio
+from unittest import TestCase
+
+from ppdpy import acompile, compiles, Dialect
+from ppdpy.exceptions import DirectiveSyntaxError
+from ppdpy.tests.samples import TEMPLATES, symbol_sets
+
+
+async def async_lines(text):
+    for line in text.split('\n'):
+        yield line
+
+
+class Writer:
+    """
+    A StreamWriter stand-in that records the writes and the drains.
+    """
+    def __init__(self):
+        self.writes = []
+        self.drains = 0
+
+    def write(self, data):
+        self.writes.append(data)
+
+    async def drain(self):
+        self.drains += 1
+
+
+class TestAcompile(TestCase):
+    def test_same_as_compile(self):
+        for text in TEMPLATES:
+            template = compiles(text)
+            compiled = asyncio.run(acompile(async_lines(text)))
+
+            for symbols in symbol_sets():
+                self.assertEqual(compiled.render(symbols), template.render(symbols))
+
+    def test_stream_reader(self):
+        async def compile_stream():
+            reader = asyncio.StreamReader()
+            reader.feed_data('--#if a\nfoo\n--#else\nbar\n--#endif\n'.encode())
+            reader.feed_eof()
+            return await acompile(reader, dialect=Dialect('--#'), mode='codegen')
+
+        template = asyncio.run(compile_stream())
+        self.assertEqual(template.render({'a'}), 'foo')
+        self.assertEqual(template.render(set()), 'bar')
+
+    def test_errors(self):
+        with self.assertRaises(DirectiveSyntaxError):
+            asyncio.run(acompile(async_lines('#if a\nfoo')))
+
+    def test_yields(self):
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def compile_large():
+            task = asyncio.ensure_future(ticker())
+            await acompile(async_lines('#if a\nfoo\n#endif\n' * 10000))
+            task.cancel()
+
+        asyncio.run(compile_large())
+        self.assertGreater(len(ticks), 1)
+
+
+class TestArenderTo(TestCase):
+    def test_same_as_render(self):
+        for text in TEMPLATES:
+            template = compiles(text)
+
+            for symbols in symbol_sets():
+                writer = Writer()
+                asyncio.run(template.arender_to(writer, symbols))
+                self.assertEqual(b''.join(writer.writes).decode(), template.render(symbols))
+
+    def test_backpressure(self):
+        template = compiles(('#if a\n%s\n#endif\n%s\n' % ('x' * 99, 'y' * 99)) * 100)
+        writer = Writer()
+        asyncio.run(template.arender_to(writer, {'a'}, buffer_size=1000))
+
+        self.assertEqual(b''.join(writer.writes).decode(), template.render({'a'}))
+        # one piece and one drain per 1000 bytes or so
+        self.assertEqual(len(writer.writes), 20)
+        self.assertEqual(writer.drains, 20)
+        self.assertTrue(all(len(data) >= 1000 for data in writer.writes[:-1]))
+
+    def test_encoding(self):
+        writer = Writer()
+        asyncio.run(compiles('#if a\nação\n#endif').arender_to(writer, {'a'}, encoding='latin-1'))
+        self.assertEqual(writer.writes, ['ação'.encode('latin-1')])
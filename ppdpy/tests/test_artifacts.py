@@ -0,0 +1,162 @@
+import io
+import marshal
+import os
+import tempfile
+import types
+from contextlib import redirect_stdout, redirect_stderr
+from unittest import TestCase
+
+from ppdpy import compiles, compile_dir, Dialect
+from ppdpy.__main__ import main
+from ppdpy.artifacts import dumps, loads, source_hash, precompile_path, precompile_dir, load_path, find_templates
+from ppdpy.exceptions import StaleArtifactError
+from ppdpy.tests.samples import TEMPLATES, symbol_sets
+
+# not valid utf-8
+UNDECODABLE = b'#if a\n\xff\xfe\n#endif\n'
+
+
+class TestArtifacts(TestCase):
+    def test_roundtrip(self):
+        for text in TEMPLATES:
+            template = compiles(text)
+            h = source_hash(text.encode())
+            loaded = loads(dumps(template, h), h)
+            self.assertEqual(loaded.referenced, template.referenced)
+
+            for symbols in symbol_sets():
+                self.assertEqual(loaded.render(symbols), template.render(symbols))
+
+    def test_deep_expression(self):
+        text = '#if ' + 'not (' * 251 + 'a' + ')' * 251 + '\nx\n#endif'
+        h = source_hash(text.encode())
+        loaded = loads(dumps(compiles(text), h), h)
+        self.assertEqual(loaded.render(set()), 'x')
+        self.assertEqual(loaded.render({'a'}), '')
+
+    def test_no_code(self):
+        # artifacts hold data only, so loading one never runs code it carries
+        for text in TEMPLATES:
+            magic, key, (ids, instructions) = marshal.loads(dumps(compiles(text), source_hash(text.encode())))
+            for instruction in instructions:
+                for value in instruction:
+                    self.assertIsInstance(value, (int, str, bytes, tuple))
+                    self.assertNotIsInstance(value, types.CodeType)
+
+    def test_stale(self):
+        data = dumps(compiles('foo'), source_hash(b'foo'))
+        with self.assertRaises(StaleArtifactError):
+            loads(data, source_hash(b'bar'))
+
+        with self.assertRaises(StaleArtifactError):
+            loads(b'garbage', source_hash(b'foo'))
+
+        with self.assertRaises(StaleArtifactError):
+            loads(b'', source_hash(b'foo'))
+
+
+class TemplateFilesTestCase(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = self.dir.name
+        os.mkdir(os.path.join(self.root, 'sub'))
+        self.write('a.sql', 'foo\n#if x\nbar\n#endif\n')
+        self.write(os.path.join('sub', 'b.sql'), 'baz\n')
+        self.write('c.txt', 'ignored\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
+
+        return path
+
+
+class TestArtifactFiles(TemplateFilesTestCase):
+    def test_precompile_and_load(self):
+        paths = precompile_dir(self.root, '*.sql')
+        self.assertEqual(paths, [
+            os.path.join(self.root, 'a.sql.ppdc'),
+            os.path.join(self.root, 'sub', 'b.sql.ppdc'),
+        ])
+
+        template = load_path(os.path.join(self.root, 'a.sql'))
+        self.assertEqual(template.render({'x'}), 'foo\nbar')
+        self.assertEqual(template.render(set()), 'foo')
+
+        # artifacts are not templates
+        self.assertEqual(len(list(find_templates(self.root))), 3)
+
+    def test_stale_file(self):
+        path = os.path.join(self.root, 'a.sql')
+        precompile_path(path)
+        self.write('a.sql', 'changed\n')
+        self.assertEqual(load_path(path).render({'x'}), 'changed')
+
+    def test_missing_artifact(self):
+        self.assertEqual(load_path(os.path.join(self.root, 'sub', 'b.sql')).render(set()), 'baz')
+
+    def test_command(self):
+        self.write('d.sql', '#if\n#endif\n')
+        self.write('e.sql', UNDECODABLE)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            status = main(['precompile', self.root, '--pattern', '*.sql'])
+
+        self.assertEqual(status, 1)
+        self.assertIn('a.sql.ppdc', stdout.getvalue())
+        self.assertIn('d.sql: error:', stderr.getvalue())
+        self.assertIn('e.sql: error: UnicodeDecodeError', stderr.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'a.sql.ppdc')))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'd.sql.ppdc')))
+
+
+class TestCompileDir(TemplateFilesTestCase):
+    def test_compile(self):
+        for workers in [1, 2]:
+            templates = compile_dir(self.root, '*.sql', workers=workers)
+            self.assertEqual(sorted(templates), ['a.sql', os.path.join('sub', 'b.sql')])
+            self.assertEqual(templates.errors, {})
+            self.assertEqual(templates['a.sql'].render({'x'}), 'foo\nbar')
+            self.assertEqual(templates[os.path.join('sub', 'b.sql')].render(set()), 'baz')
+
+    def test_errors(self):
+        self.write('bad.sql', '#if x\nfoo\n')
+        self.write('worse.sql', '#if x and\n#endif\n')
+        self.write('binary.sql', UNDECODABLE)
+        for workers in [1, 2]:
+            templates = compile_dir(self.root, '*.sql', workers=workers)
+
+            self.assertEqual(sorted(templates), ['a.sql', os.path.join('sub', 'b.sql')])
+            self.assertEqual(sorted(templates.errors), ['bad.sql', 'binary.sql', 'worse.sql'])
+            self.assertEqual(templates.errors['bad.sql'].message, 'missing end directive')
+            self.assertIsInstance(templates.errors['binary.sql'], UnicodeDecodeError)
+
+    def test_deep_expression(self):
+        self.write('deep.sql', '#if ' + 'not (' * 5000 + 'a' + ')' * 5000 + '\nfoo\n#endif\n')
+        templates = compile_dir(self.root, 'deep.sql', workers=2)
+        self.assertEqual(templates.errors, {})
+        self.assertEqual(templates['deep.sql'].render({'a'}), 'foo')
+
+    def test_options(self):
+        self.write('d.sql', '--#if x\nfoo\n--#endif\n')
+        templates = compile_dir(self.root, 'd.sql', workers=2, mode='codegen', dialect=Dialect('--#'))
+        self.assertEqual(templates['d.sql'].render({'x'}), 'foo')
+        self.assertEqual(templates['d.sql'].__class__.__name__, 'CodegenTemplate')
+
+    def test_empty(self):
+        self.assertEqual(compile_dir(self.root, '*.none', workers=2), {})
+
+
+class TestDeepArtifacts(TestCase):
+    def test_deep_nesting(self):
+        text = '\n'.join(['#if a'] * 3000 + ['foo'] + ['#elif b\nbar\n#else\nbaz\n#endif'] * 3000)
+        template = compiles(text)
+        h = source_hash(text.encode())
+        loaded = loads(dumps(template, h), h)
+
+        for symbols in symbol_sets(['a', 'b']):
+            self.assertEqual(loaded.render(symbols), template.render(symbols))
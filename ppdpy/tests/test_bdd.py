@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+from ppdpy import compiles
+from ppdpy.bdd import BddTemplate, Diagram
+from ppdpy.expression_compiler import compile as compile_expression
+from ppdpy.symbols import SymbolTable
+from ppdpy.template_compiler import IfBlock
+from ppdpy.tests.samples import TEMPLATES, symbol_sets
+
+
+class TestDiagram(TestCase):
+    def test_expression(self):
+        for text in ['a and b', 'not a or b and c', 'not (a and (b or not c))', 'a or not a']:
+            expression = compile_expression(text)
+            table = SymbolTable(['a', 'b', 'c'])
+            diagram = Diagram()
+            root = diagram.expression(expression, table)
+
+            for symbols in symbol_sets(['a', 'b', 'c']):
+                self.assertEqual(diagram.select(root, table.mask(symbols)), expression.eval(symbols))
+
+    def test_reduced(self):
+        diagram = Diagram()
+        table = SymbolTable()
+        first = diagram.expression(compile_expression('a and b'), table)
+        second = diagram.expression(compile_expression('not (not b or not a)'), table)
+        self.assertEqual(first, second)
+        self.assertEqual(diagram.expression(compile_expression('a or not a'), table), Diagram.TRUE)
+
+    def test_count(self):
+        diagram = Diagram()
+        table = SymbolTable(['a', 'b', 'c'])
+        root = diagram.expression(compile_expression('a and c'), table)
+        self.assertEqual(diagram.count(root, 3), {True: 2, False: 6})
+        self.assertEqual(diagram.count(Diagram.TRUE, 3), {True: 8})
+
+    def test_many_symbols(self):
+        # more symbol levels than the recursion limit
+        names = ['s%d' % i for i in range(2000)]
+        diagram = Diagram()
+        table = SymbolTable()
+        root = diagram.expression(compile_expression(' or '.join(names)), table)
+        self.assertTrue(diagram.select(root, table.mask({'s1999'})))
+        self.assertFalse(diagram.select(root, 0))
+
+        template = compiles('#if ' + ' and '.join(names) + '\nfoo\n#elif s0\nbar\n#endif', mode='bdd')
+        self.assertEqual(template.render(names), 'foo')
+        self.assertEqual(template.render({'s0'}), 'bar')
+        self.assertEqual(template.render(set()), '')
+
+
+class TestBddTemplate(TestCase):
+    def test_same_as_tree(self):
+        for text in TEMPLATES:
+            tree = compiles(text)
+            bdd = compiles(text, mode='bdd')
+            self.assertIsInstance(bdd, BddTemplate)
+
+            for symbols in symbol_sets():
+                self.assertEqual(bdd.render(symbols), tree.render(symbols))
+                self.assertEqual(list(bdd.iter_render(symbols)), list(tree.iter_render(symbols)))
+
+    def test_single_test_per_symbol(self):
+        text = '#if a and b\n1\n#elif a and not b\n2\n#elif not a and b\n3\n#else\n4\n#endif'
+        template = compiles(text, mode='bdd')
+        [block] = [b for b in template._blocks if isinstance(b, IfBlock)]
+        root, entries = template._roots[id(block)]
+        diagram = template._diagram
+
+        # a full binary tree over a and b: every path tests each symbol once
+        self.assertEqual(len({diagram.low[root], diagram.high[root]}), 2)
+        for symbols, expected in [({'a', 'b'}, '1'), ({'a'}, '2'), ({'b'}, '3'), (set(), '4')]:
+            self.assertEqual(template.render(symbols), expected)
+
+    def test_branch_counts(self):
+        template = compiles('#if a\n1\n#elif b\n2\n#elif a and b\n3\n#endif', mode='bdd')
+        [block] = [b for b in template._blocks if isinstance(b, IfBlock)]
+        # the third entry is never taken, and neither symbol leaves one in four
+        self.assertEqual(template.branch_counts(block), {0: 2, 1: 1, 3: 1})
+
+    def test_decision_count(self):
+        for text in TEMPLATES:
+            template = compiles(text, mode='bdd')
+            names = sorted(template.referenced)
+            decisions = {template._decide(template._symbols.mask(symbols)) for symbols in symbol_sets(names)}
+            self.assertEqual(template.decision_count(), len(decisions))
+
+    def test_nested_decisions(self):
+        text = '#if a\n#if b\nx\n#endif\n#elif b\ny\n#endif\n#if b\nz\n#endif'
+        template = compiles(text, mode='bdd')
+        # (a, b): (1, 1), (1, 0), (0, 1), (0, 0) all decide differently
+        self.assertEqual(template.decision_count(), 4)
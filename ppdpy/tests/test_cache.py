@@ -0,0 +1,98 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+import ppdpy
+from ppdpy.cache import CompileCache
+from ppdpy.exceptions import DirectiveSyntaxError
+
+
+class TestCompileCache(TestCase):
+    def tearDown(self):
+        ppdpy.disable_compile_cache()
+
+    def test_renders(self):
+        self.assertIsNone(ppdpy.compile_cache_info())
+        ppdpy.enable_compile_cache(2)
+
+        text = '#if a\nfoo\n#endif\n'
+        self.assertEqual(ppdpy.renders(text, {'a'}), 'foo\n')
+        self.assertEqual(ppdpy.renders(text, set()), '')
+        self.assertEqual(ppdpy.renders('bar', set()), 'bar')
+        self.assertEqual(ppdpy.compile_cache_info(), (1, 2, 2, 2))
+
+        ppdpy.disable_compile_cache()
+        self.assertIsNone(ppdpy.compile_cache_info())
+
+    def test_prefix_change(self):
+        ppdpy.enable_compile_cache()
+        text = '--#if a\nfoo\n--#endif'
+        try:
+            ppdpy.set_directive_prefix('--#')
+            self.assertEqual(ppdpy.renders(text, set()), '')
+
+        finally:
+            ppdpy.set_directive_prefix('#')
+
+        # compiled again with the current default dialect
+        self.assertEqual(ppdpy.renders(text, set()), text)
+
+    def test_render_file(self):
+        ppdpy.enable_compile_cache()
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'template.txt')
+            with open(path, 'w') as f:
+                f.write('foo\n#if a\nbar\n#endif\n')
+
+            for i in range(2):
+                with open(path) as f:
+                    self.assertEqual(ppdpy.render(f, {'a'}), 'foo\nbar')
+
+            self.assertEqual(ppdpy.compile_cache_info().hits, 1)
+
+            # a change in size invalidates the cached template
+            with open(path, 'w') as f:
+                f.write('changed\n')
+
+            with open(path) as f:
+                self.assertEqual(ppdpy.render(f, {'a'}), 'changed')
+
+            self.assertEqual(ppdpy.compile_cache_info().misses, 2)
+
+    def test_not_file_backed(self):
+        ppdpy.enable_compile_cache()
+        self.assertEqual(ppdpy.render(io.StringIO('foo\n'), set()), 'foo')
+        self.assertEqual(ppdpy.render(['foo', 'bar'], set()), 'foo\nbar')
+        self.assertEqual(ppdpy.compile_cache_info().currsize, 0)
+
+    def test_single_flight(self):
+        cache = CompileCache()
+        calls = []
+        results = []
+
+        def compile():
+            calls.append(1)
+            time.sleep(0.05)
+            return ppdpy.compiles('foo')
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get('key', compile))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_errors(self):
+        cache = CompileCache()
+        with self.assertRaises(DirectiveSyntaxError):
+            cache.compile_text('#if')
+
+        self.assertEqual(cache.info().currsize, 0)
+        self.assertEqual(cache.compile_text('#if a\n#endif').render({'a'}), '')
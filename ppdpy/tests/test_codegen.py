@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+from ppdpy import compiles
+from ppdpy.codegen import CodegenTemplate, generate_source
+from ppdpy.tests.samples import TEMPLATES, symbol_sets
+
+
+class TestCodegen(TestCase):
+    def test_same_as_tree(self):
+        for text in TEMPLATES:
+            tree = compiles(text)
+            codegen = compiles(text, mode='codegen')
+            self.assertIsInstance(codegen, CodegenTemplate)
+
+            for symbols in symbol_sets():
+                self.assertEqual(codegen.render(symbols), tree.render(symbols))
+
+    def test_symbols(self):
+        template = compiles('#if x\nfoo\n#endif\nbar', mode='codegen')
+        self.assertEqual(template.render({'x': 1}), 'foo\nbar')
+        self.assertEqual(template.render(['x']), 'foo\nbar')
+        self.assertEqual(template.render([]), 'bar')
+
+    def test_source(self):
+        template = compiles('#if x\n#else\nfoo\n#endif')
+        source = generate_source(template._blocks, template._symbols)
+        self.assertIn("if (mask & 1 != 0):", source)
+        self.assertIn("append('foo\\n')", source)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            compiles('foo', mode='foo')
+
+    def test_deep_nesting(self):
+        text = '\n'.join(['#if a'] * 500 + ['foo'] + ['#else\nbar\n#endif'] * 500)
+        tree = compiles(text)
+        codegen = compiles(text, mode='codegen')
+        self.assertEqual(codegen.render({'a'}), tree.render({'a'}))
+        self.assertEqual(codegen.render(set()), tree.render(set()))
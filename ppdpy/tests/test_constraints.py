@@ -0,0 +1,105 @@
+import itertools
+from unittest import TestCase
+
+import ppdpy
+from ppdpy.constraints import Constraints, PrunedBranch
+
+
+TEXT = '''select
+#if order_by_join_date
+joined_at
+#elif order_by_readcount
+4
+#elif order_by_join_date and name
+dead
+#else
+name
+#endif
+#if sort_ascending and sort_descending
+never
+#if nested
+never nested
+#endif
+#elif sort_ascending or unread
+ASC
+#endif
+#if unread and not joined
+unread without join
+#endif
+#if postgres and unread
+postgres
+#endif'''
+
+CONSTRAINTS = Constraints(
+    exclusive=[{'order_by_join_date', 'order_by_readcount'}, {'sort_ascending', 'sort_descending'}],
+    implies=[('unread', 'joined')],
+    present={'postgres'},
+)
+
+NAMES = ['order_by_join_date', 'order_by_readcount', 'name', 'sort_ascending', 'sort_descending', 'nested',
+         'unread', 'joined']
+
+
+def satisfying():
+    for bits in itertools.product([False, True], repeat=len(NAMES)):
+        symbols = {name for name, bit in zip(NAMES, bits) if bit} | {'postgres'}
+        if {'order_by_join_date', 'order_by_readcount'} <= symbols:
+            continue
+
+        if {'sort_ascending', 'sort_descending'} <= symbols:
+            continue
+
+        if 'unread' in symbols and 'joined' not in symbols:
+            continue
+
+        yield symbols
+
+
+class TestConstraints(TestCase):
+    def test_pruned(self):
+        template = ppdpy.compiles(TEXT, constraints=CONSTRAINTS)
+        self.assertEqual(template.pruned, (
+            PrunedBranch(2, 'elif', '(order_by_join_date and name)'),
+            PrunedBranch(4, 'if', '(sort_ascending and sort_descending)'),
+            PrunedBranch(7, 'if', '(unread and (not joined))'),
+        ))
+        self.assertEqual(template.referenced, {'order_by_join_date', 'order_by_readcount', 'sort_ascending', 'unread'})
+        self.assertEqual(ppdpy.compiles(TEXT).pruned, ())
+
+    def test_renders(self):
+        original = ppdpy.compiles(TEXT)
+        for mode in (ppdpy.MODE_TREE, ppdpy.MODE_CODEGEN, ppdpy.MODE_BDD):
+            for optimize in (False, True):
+                template = ppdpy.compiles(TEXT, mode=mode, optimize=optimize, constraints=CONSTRAINTS)
+                self.assertEqual(len(template.pruned), 3)
+                for symbols in satisfying():
+                    self.assertEqual(template.render(symbols), original.render(symbols), (mode, symbols))
+
+    def test_always_taken(self):
+        text = '#if a\nfoo\n#elif b\nbar\n#else\nbaz\n#endif'
+        template = ppdpy.compiles(text, constraints=Constraints(present={'b'}, absent={'a'}))
+        self.assertEqual(template.render(set()), 'bar')
+        self.assertEqual(template.pruned, (PrunedBranch(0, 'if', 'a'), PrunedBranch(2, 'else', None)))
+
+    def test_large(self):
+        names = ['s%d' % i for i in range(1500)]
+        text = '#if ' + ' and '.join(names) + '\nfoo\n#elif s1 and zz\ndead\n#endif'
+        template = ppdpy.compiles(text, constraints=Constraints(exclusive=[{'s1', 'zz'}]))
+        self.assertEqual(template.pruned, (PrunedBranch(1, 'elif', '(s1 and zz)'),))
+        self.assertEqual(template.render(names), 'foo')
+        self.assertEqual(template.render({'s1'}), '')
+
+    def test_deep(self):
+        deep = 'not (' * 5001 + 'a' + ')' * 5001
+        text = '#if b\nfoo\n#elif ' + deep + ' or c\nbar\n#endif'
+        template = ppdpy.compiles(text, constraints=Constraints(present={'a'}, absent={'c'}))
+        self.assertEqual(template.pruned, (PrunedBranch(1, 'elif', '(' + '(not ' * 5001 + 'a' + ')' * 5001 + ' or c)'),))
+        self.assertEqual(template.render({'a', 'b'}), 'foo')
+        self.assertEqual(template.render({'a'}), '')
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Constraints(present={'a'}, absent={'a'})
+
+        with self.assertRaises(ValueError):
+            ppdpy.compiles('foo', constraints=Constraints(implies=[('a', 'b')], present={'a'}, absent={'b'}))
@@ -1,6 +1,9 @@
 from unittest import TestCase
 
-from ppdpy.expression_compiler import lex, compile
+from itertools import combinations
+
+from ppdpy.expression_compiler import lex, compile, compile_function, to_function, to_mask_function
+from ppdpy.symbols import SymbolTable
 from ppdpy.exceptions import ExpressionSyntaxError
 from ppdpy.nodes import *
 
@@ -47,6 +50,12 @@ class TestLex(TestCase):
         self.assertEqual(list(lex('a and not(b or c)')), ['a', 'and', 'not', '(', 'b', 'or', 'c', ')'])
         self.assertEqual(list(lex('  a    and  (b   or  c) ')), ['a', 'and', '(', 'b', 'or', 'c', ')'])
 
+    def test_operators(self):
+        self.assertEqual(list(lex('a AND b Or NoT c')), ['a', 'and', 'b', 'or', 'not', 'c'])
+        self.assertEqual(list(lex('android order nothing')), ['android', 'order', 'nothing'])
+        # only spaces separate tokens
+        self.assertEqual(list(lex('a\tand b')), ['a\tand', 'b'])
+
 
 class TestParse(TestCase):
     def test_simple(self):
@@ -57,12 +66,12 @@ class TestParse(TestCase):
         self.assertEqual(compile('not A'), Not(Id('A')))
 
         self.assertEqual(compile('a and b'), And(Id('a'), Id('b')))
-        self.assertEqual(compile('a and b and c'), And(And(Id('a'), Id('b')), Id('c')))
-        self.assertEqual(compile('a and b and c and d'), And(And(And(Id('a'), Id('b')), Id('c')), Id('d')))
+        self.assertEqual(compile('a and b and c'), And(Id('a'), And(Id('b'), Id('c'))))
+        self.assertEqual(compile('a and b and c and d'), And(And(Id('a'), Id('b')), And(Id('c'), Id('d'))))
 
         self.assertEqual(compile('a or b'), Or(Id('a'), Id('b')))
         self.assertEqual(compile('a or b or c'), Or(Id('a'), Or(Id('b'), Id('c'))))
-        self.assertEqual(compile('a or b or c or d'), Or(Id('a'), Or(Id('b'), Or(Id('c'), Id('d')))))
+        self.assertEqual(compile('a or b or c or d'), Or(Or(Id('a'), Id('b')), Or(Id('c'), Id('d'))))
 
     def test_case_sensitivity(self):
         self.assertEqual(compile('NOT a'), Not(Id('a')))
@@ -117,6 +126,59 @@ class TestParse(TestCase):
         self.assertEqual(compile('a or not b'), compile('a or (not b)'))
         self.assertEqual(compile('not a or b'), compile('(not a) or b'))
 
+    def test_long_chains(self):
+        ids = ['s%d' % i for i in range(5000)]
+        node = compile(' or '.join(ids))
+        self.assertEqual(flatten(node, Or), [Id(id) for id in ids])
+        self.assertTrue(node.eval({'s4999'}))
+        self.assertFalse(node.eval(set()))
+
+        # balanced trees have logarithmic depth
+        depth = 0
+        while isinstance(node, Or):
+            node = node.left
+            depth += 1
+
+        self.assertLessEqual(depth, 13)
+
+    def test_deep_parens(self):
+        node = compile('(' * 5000 + 'a' + ')' * 5000)
+        self.assertEqual(node, Id('a'))
+
+        node = compile('not (' * 101 + 'a' + ')' * 101)
+        self.assertTrue(node.eval(set()))
+
+        function = compile_function('not (' * 251 + 'a' + ')' * 251)
+        self.assertTrue(function(set()))
+        self.assertFalse(function({'a'}))
+
+        table = SymbolTable()
+        function = to_mask_function(compile('not (' * 251 + 'a' + ')' * 251), table)
+        self.assertTrue(function(table.mask(set())))
+        self.assertFalse(function(table.mask({'a'})))
+
+    def test_shared(self):
+        table = SymbolTable(['a', 'b'])
+        functions = {}
+        first = to_mask_function(compile('a and not b'), table, functions)
+        self.assertIs(to_mask_function(compile('a and not b'), table, functions), first)
+        self.assertIsNot(to_mask_function(compile('a and not b'), table), first)
+
+    def test_error_messages(self):
+        for text, message in [
+                ('', 'empty expression'),
+                ('and', 'error parsing expression beginning'),
+                ('a or )', 'error parsing expression beginning'),
+                ('a and )', 'unexpected token after and'),
+                ('a and and', 'unexpected token after and'),
+                ('a and or b', 'unexpected token after and'),
+                ('a and (or)', 'error parsing expression beginning'),
+                ('(a', 'right parens expected')]:
+            with self.assertRaises(ExpressionSyntaxError) as raised:
+                compile(text)
+
+            self.assertEqual(raised.exception.message, message, text)
+
     def test_errors(self):
         with self.assertRaises(ExpressionSyntaxError):
             compile('')
@@ -211,6 +273,18 @@ class TestParse(TestCase):
         with self.assertRaises(ExpressionSyntaxError):
             compile('(a and b) or c)')
 
+        with self.assertRaises(ExpressionSyntaxError):
+            compile('not not a')
+
+        with self.assertRaises(ExpressionSyntaxError):
+            compile('a and not not b')
+
+        with self.assertRaises(ExpressionSyntaxError):
+            compile('a b')
+
+        with self.assertRaises(ExpressionSyntaxError):
+            compile('a (b)')
+
 
 class TestEval(TestCase):
     def test_eval_simple(self):
@@ -290,3 +364,56 @@ class TestEval(TestCase):
         self.assertEqual(expression.eval({'c'}), True)
         self.assertEqual(expression.eval(set()), True)
 
+
+class TestFunction(TestCase):
+    def assertSameAsEval(self, text, ids):
+        node = compile(text)
+        function = to_function(node)
+        table = SymbolTable()
+        mask_function = to_mask_function(node, table)
+        for n in range(len(ids) + 1):
+            for symbols in combinations(ids, n):
+                expected = node.eval(set(symbols))
+                self.assertEqual(function(set(symbols)), expected, (text, symbols))
+                self.assertIs(mask_function(table.mask(symbols)), expected, (text, symbols))
+
+    def test_function(self):
+        self.assertSameAsEval('a', 'ab')
+        self.assertSameAsEval('not a', 'ab')
+        self.assertSameAsEval('a and b', 'abc')
+        self.assertSameAsEval('a or b and not c', 'abc')
+        self.assertSameAsEval('not (a and b) or c', 'abc')
+        self.assertSameAsEval('a and (not b or c) and not (d or a)', 'abcd')
+        self.assertSameAsEval('a and not b and c and not d', 'abcd')
+        self.assertSameAsEval('a or not b or c or not d', 'abcd')
+        self.assertSameAsEval('not a or not b', 'ab')
+        self.assertSameAsEval('a and not a', 'a')
+        self.assertSameAsEval('a or not a', 'a')
+        self.assertSameAsEval('(a or b) and (not c or d and not a)', 'abcd')
+
+    def test_source(self):
+        self.assertEqual(compile('a and b and c').to_source(repr), "('a' and 'b' and 'c')")
+        self.assertEqual(compile('a or b and not c').to_source(repr), "('a' or ('b' and (not 'c')))")
+
+    def test_quoted_ids(self):
+        function = compile_function("it's or \\x")
+        self.assertTrue(function({"it's"}))
+        self.assertTrue(function({'\\x'}))
+        self.assertFalse(function(set()))
+
+    def test_long_chain(self):
+        node = Id('s0')
+        for i in range(1, 2000):
+            node = And(node, Id('s%d' % i))
+
+        function = to_function(node)
+        self.assertTrue(function({'s%d' % i for i in range(2000)}))
+        self.assertFalse(function({'s%d' % i for i in range(1999)}))
+
+    def test_many_symbols(self):
+        # masks too large to be written in decimal
+        table = SymbolTable('s%d' % i for i in range(20000))
+        function = to_mask_function(compile('s19999 and not s19998 or s1 and s19997'), table)
+        self.assertTrue(function(table.mask({'s19999'})))
+        self.assertFalse(function(table.mask({'s19999', 's19998'})))
+        self.assertTrue(function(table.mask({'s19998', 's1', 's19997'})))
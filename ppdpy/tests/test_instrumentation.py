@@ -0,0 +1,115 @@
+import gc
+import io
+from unittest import TestCase
+
+import ppdpy
+from ppdpy.instrumentation import Instrumentation
+
+
+TEXT = '''a
+#if x
+b
+#if y
+c
+#endif
+#elif z
+d
+#else
+e
+#endif
+f'''
+
+
+class TestInstrumentation(TestCase):
+    def tearDown(self):
+        ppdpy.disable_instrumentation()
+
+    def test_disabled(self):
+        self.assertIsNone(ppdpy.instrumentation_snapshot())
+        template = ppdpy.compiles(TEXT)
+        self.assertIsNone(template._observer)
+
+    def test_counts(self):
+        ppdpy.enable_instrumentation()
+        template = ppdpy.compiles(TEXT)
+
+        self.assertEqual(template.render({'x', 'y'}), 'a\nb\nc\nf')
+        self.assertEqual(template.render({'x'}), 'a\nb\nf')
+        self.assertEqual(template.render({'z'}), 'a\nd\nf')
+        self.assertEqual(template.render(set()), 'a\ne\nf')
+
+        stats, = ppdpy.instrumentation_snapshot()
+        self.assertIsNone(stats.name)
+        self.assertEqual(stats.compiles, 1)
+        self.assertGreater(stats.compile_time, 0)
+        self.assertEqual(stats.renders, 4)
+        self.assertGreater(stats.render_time, 0)
+        # #if x, #if y, #elif z, #else
+        self.assertEqual(stats.branches, (2, 1, 1, 1))
+
+    def test_modes(self):
+        ppdpy.enable_instrumentation()
+        for mode in (ppdpy.MODE_TREE, ppdpy.MODE_CODEGEN, ppdpy.MODE_BDD):
+            template = ppdpy.compiles(TEXT, mode=mode, variants=True)
+            self.assertEqual(template.render({'x', 'y'}), 'a\nb\nc\nf')
+            self.assertEqual(template.render({'z'}), 'a\nd\nf')
+            self.assertEqual(ppdpy.instrumentation_snapshot()[-1].branches, (1, 1, 1, 0))
+
+    def test_render_methods(self):
+        ppdpy.enable_instrumentation()
+        template = ppdpy.compiles(TEXT, variants=True)
+        self.assertEqual(''.join(template.iter_render({'x', 'y'})), 'a\nb\nc\nf')
+        template.render_to(io.StringIO(), {'z'})
+        self.assertEqual(template.render_many([{'x'}, {'x'}, set()]), ['a\nb\nf', 'a\nb\nf', 'a\ne\nf'])
+
+        stats, = ppdpy.instrumentation_snapshot()
+        self.assertEqual(stats.renders, 5)
+        self.assertEqual(stats.branches, (3, 1, 1, 1))
+
+    def test_convenience(self):
+        for cache in (False, True):
+            if cache:
+                ppdpy.enable_compile_cache()
+
+            ppdpy.enable_instrumentation()
+            try:
+                for symbols in ({'x'}, {'x', 'y'}, {'z'}):
+                    ppdpy.renders(TEXT, symbols)
+
+                f = io.StringIO(TEXT)
+                f.name = 'query.sql'
+                ppdpy.render(f, {'x'})
+
+            finally:
+                ppdpy.disable_compile_cache()
+
+            text, file = ppdpy.instrumentation_snapshot()
+            self.assertEqual(text.compiles, 1 if cache else 3)
+            self.assertEqual(text.renders, 3)
+            self.assertEqual(text.branches, (2, 1, 1, 0))
+            self.assertEqual(file.name, 'query.sql')
+            self.assertEqual(file.renders, 1)
+
+    def test_file_name(self):
+        ppdpy.enable_instrumentation()
+        f = io.StringIO(TEXT)
+        f.name = 'query.sql'
+        template = ppdpy.compile(f)
+        self.assertEqual(ppdpy.instrumentation_snapshot()[0].name, 'query.sql')
+
+    def test_callback(self):
+        events = []
+        ppdpy.enable_instrumentation(lambda event, template, seconds: events.append((event, template)))
+        template = ppdpy.compiles(TEXT)
+        template.render({'x'})
+        self.assertEqual(events, [('compile', template), ('render', template)])
+
+    def test_released(self):
+        instrumentation = Instrumentation()
+        template = instrumentation.attach(ppdpy.compiles(TEXT))
+        template.render({'x'})
+        self.assertEqual(instrumentation.stats(template).renders, 1)
+
+        del template
+        gc.collect()
+        self.assertEqual(instrumentation.snapshot(), [])
@@ -0,0 +1,56 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import ppdpy
+from ppdpy.mapped import MappedTextBlock
+from ppdpy.tests.samples import TEMPLATES, symbol_sets
+
+
+class TestCompilePath(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'template.txt')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def assertSameAsCompile(self, data, symbol_sets):
+        self.write(data)
+        mapped = ppdpy.compile_path(self.path)
+        with open(self.path, newline='') as f:
+            expected = ppdpy.compile(f)
+
+        for symbols in symbol_sets:
+            self.assertEqual(mapped.render(symbols), expected.render(symbols), (data, symbols))
+
+    def test_same_as_compile(self):
+        for text in TEMPLATES:
+            self.assertSameAsCompile(text.encode(), symbol_sets())
+
+    def test_line_endings(self):
+        sets = [set(), {'a'}]
+        self.assertSameAsCompile(b'foo\r\n#if a\r\nbar\r\n#endif\r\nbaz', sets)
+        self.assertSameAsCompile(b'foo\n\nbar', sets)
+        self.assertSameAsCompile(b'\n', sets)
+        self.assertSameAsCompile(b'', sets)
+
+    def test_encoding(self):
+        self.assertSameAsCompile('ação\n#if a\nñandú\n#endif\n'.encode(), [set(), {'a'}])
+
+    def test_spans(self):
+        self.write(b'foo\n#if a\nbar\nbaz\n#endif\n')
+        template = ppdpy.compile_path(self.path)
+        block = template._blocks[1]._if_entries[0]._blocks[0]
+        self.assertIsInstance(block, MappedTextBlock)
+        self.assertEqual((block.offset, block.length), (10, 8))
+        self.assertEqual(template.render({'a'}), 'foo\nbar\nbaz')
+
+    def test_modes(self):
+        self.write(b'foo\n#if a\nbar\n#endif\n')
+        for template in (ppdpy.compile_path(self.path, mode='codegen'), ppdpy.compile_path(self.path, variants=True)):
+            self.assertEqual(template.render({'a'}), 'foo\nbar')
@@ -0,0 +1,137 @@
+from unittest import TestCase
+
+from ppdpy import compiles
+from ppdpy.expression_compiler import compile as compile_expression
+from ppdpy.nodes import Id, Not
+from ppdpy.optimizer import Simplifier, optimize, TRUE, FALSE
+from ppdpy.template_compiler import IfBlock, TextBlock
+from ppdpy.tests.samples import TEMPLATES, symbol_sets
+
+
+class TestSimplifier(TestCase):
+    def simplify(self, text):
+        return Simplifier().simplify(compile_expression(text))
+
+    def test_double_negation(self):
+        self.assertEqual(self.simplify('not (not a)')._to_tuple(), ('id', 'a'))
+        self.assertEqual(self.simplify('not (not (not a))')._to_tuple(), ('not', ('id', 'a')))
+
+    def test_duplicates(self):
+        self.assertEqual(self.simplify('a and a')._to_tuple(), ('id', 'a'))
+        self.assertEqual(self.simplify('a or (b or a)')._to_tuple(), ('or', ('id', 'a'), ('id', 'b')))
+
+    def test_constants(self):
+        self.assertIs(self.simplify('a and not a'), FALSE)
+        self.assertIs(self.simplify('a or not a'), TRUE)
+        self.assertIs(self.simplify('b or (a and not a) or not b'), TRUE)
+        self.assertEqual(self.simplify('b and (a or not a)')._to_tuple(), ('id', 'b'))
+
+    def test_hash_consing(self):
+        simplifier = Simplifier()
+        first = simplifier.simplify(compile_expression('a and (b or c)'))
+        second = simplifier.simplify(compile_expression('(c or b) and not (not a)'))
+        self.assertIs(first, second)
+        self.assertIs(simplifier.simplify(Id('a')), simplifier.simplify(Not(Not(Id('a')))))
+
+    def test_same_values(self):
+        texts = ['a and not (b or not a)', 'not (a and b) or c', 'a or b and not b', 'not (not (a and a or b))']
+        for text in texts:
+            expression = compile_expression(text)
+            simplified = Simplifier().simplify(expression)
+            for symbols in symbol_sets(['a', 'b', 'c']):
+                self.assertEqual(simplified.eval(symbols), expression.eval(symbols))
+
+
+class TestOptimize(TestCase):
+    def test_same_as_original(self):
+        for text in TEMPLATES:
+            template = compiles(text)
+            optimized = optimize(template)
+
+            for symbols in symbol_sets():
+                self.assertEqual(optimized.render(symbols), template.render(symbols))
+
+    def test_compile_option(self):
+        template = compiles('#if a and not a\nfoo\n#endif\nbar', optimize=True)
+        self.assertEqual(template.render({'a'}), 'bar')
+        self.assertEqual(template._blocks[0].text, 'bar\n')
+
+    def test_resolved_branches(self):
+        template = compiles('x\n#if a or not a\nfoo\n#else\nbar\n#endif\ny', optimize=True)
+        self.assertEqual(len(template._blocks), 1)
+        self.assertEqual(template.render([]), 'x\nfoo\ny')
+
+        template = compiles('#if a and not a\nfoo\n#elif b\nbar\n#elif b or not b\nbaz\n#else\nqux\n#endif', optimize=True)
+        [block] = template._blocks
+        self.assertIsInstance(block, IfBlock)
+        self.assertEqual(len(block._if_entries), 2)
+        self.assertEqual(template.render(['b']), 'bar')
+        self.assertEqual(template.render([]), 'baz')
+
+    def test_shared_tests(self):
+        text = '#if a and (b or c)\nfoo\n#endif\n#if (c or b) and a\nbar\n#endif'
+        template = compiles(text, optimize=True)
+        first, second = [block._if_entries[0] for block in template._blocks if isinstance(block, IfBlock)]
+        self.assertIs(first._expression, second._expression)
+        self.assertIs(first.test(), second.test())
+
+    def test_memoized_tests(self):
+        condition = '(a or b) and (c or d) and not (e and f)'
+        template = compiles('#if %s\nfoo\n#endif\n#if %s\nbar\n#endif' % (condition, condition), optimize=True)
+        original = compiles('#if %s\nfoo\n#endif\n#if %s\nbar\n#endif' % (condition, condition))
+
+        for symbols in symbol_sets(['a', 'b', 'c', 'd', 'e', 'f']):
+            self.assertEqual(template.render(symbols), original.render(symbols))
+
+    def test_codegen(self):
+        for text in TEMPLATES:
+            template = compiles(text)
+            codegen = compiles(text, mode='codegen', optimize=True)
+
+            for symbols in symbol_sets():
+                self.assertEqual(codegen.render(symbols), template.render(symbols))
+
+    def test_merged_text(self):
+        template = compiles('a\n#if x and not x\nfoo\n#endif\nb', optimize=True)
+        self.assertEqual([b.__class__ for b in template._blocks], [TextBlock])
+        self.assertEqual(template.render([]), 'a\nb')
+
+
+class TestSpecialize(TestCase):
+    def test_same_as_original(self):
+        for text in TEMPLATES:
+            template = compiles(text)
+            names = sorted(template.referenced)
+
+            for static in symbol_sets(names[:2]):
+                true = set(static)
+                false = set(names[:2]) - true
+                specialized = template.specialize(true=true, false=false)
+                self.assertTrue(specialized.referenced.isdisjoint(names[:2]))
+
+                for symbols in symbol_sets(names[2:]):
+                    self.assertEqual(specialized.render(symbols), template.render(set(symbols) | true))
+
+    def test_resolved(self):
+        text = 'select *\n#if postgres\nilike\n#elif mysql and not legacy\nlike\n#else\n#if debug\n-- fallback\n#endif\nlower\n#endif\nend'
+        template = compiles(text)
+
+        specialized = template.specialize(true={'postgres'})
+        self.assertEqual([b.__class__ for b in specialized._blocks], [TextBlock])
+        self.assertEqual(specialized.render([]), 'select *\nilike\nend')
+
+        specialized = template.specialize(true={'mysql'}, false={'postgres'})
+        self.assertEqual(specialized.referenced, {'legacy', 'debug'})
+        [block] = [b for b in specialized._blocks if isinstance(b, IfBlock)]
+        self.assertEqual(block._if_entries[0]._expression._to_tuple(), ('not', ('id', 'legacy')))
+        self.assertEqual(specialized.render({'legacy', 'debug'}), 'select *\n-- fallback\nlower\nend')
+
+    def test_keeps_class(self):
+        template = compiles('#if a\nfoo\n#elif b\nbar\n#endif', mode='codegen')
+        specialized = template.specialize(false={'a'})
+        self.assertIs(specialized.__class__, template.__class__)
+        self.assertEqual(specialized.render({'b'}), 'bar')
+
+    def test_conflict(self):
+        with self.assertRaises(ValueError):
+            compiles('foo').specialize(true={'a'}, false={'a', 'b'})
@@ -0,0 +1,94 @@
+from itertools import combinations
+from unittest import TestCase
+
+from ppdpy.expression_compiler import compile
+from ppdpy.nodes import *
+from ppdpy.program import Program
+from ppdpy.symbols import SymbolTable
+
+
+EXPRESSIONS = [
+    'a',
+    'not a',
+    'a and b',
+    'a or b',
+    'a and not b or c',
+    'not (a or b) and c',
+    '(a or b) and (c or not (a and b))',
+    'not (not (a and (b or (c and not a))))',
+]
+
+
+class TestProgram(TestCase):
+    def test_eval(self):
+        symbols = ['a', 'b', 'c']
+        for text in EXPRESSIONS:
+            node = compile(text)
+            table = SymbolTable(symbols)
+            test = Program.from_node(node).mask_function(table)
+            for n in range(len(symbols) + 1):
+                for subset in combinations(symbols, n):
+                    self.assertEqual(test(table.mask(subset)), node.eval(set(subset)), (text, subset))
+
+    def test_const(self):
+        table = SymbolTable(['a'])
+        self.assertTrue(Program.from_node(Or(Const(False), Not(Const(False)))).mask_function(table)(0))
+        self.assertFalse(Program.from_node(And(Id('a'), Const(False))).mask_function(table)(1))
+
+    def test_code(self):
+        program = Program.from_node(compile('a and not b or a'))
+        self.assertEqual(program.ids, ('a', 'b'))
+        # TEST a, JUMP_IF_FALSE 4, TEST b, NOT, JUMP_IF_TRUE 6, TEST a
+        self.assertEqual(list(program.code), [0, 0, 3, 4, 0, 1, 2, 0, 4, 6, 0, 0])
+
+    def test_to_node(self):
+        for text in EXPRESSIONS:
+            node = compile(text)
+            self.assertEqual(Program.from_node(node).to_node()._to_tuple(), node._to_tuple())
+
+    def test_long(self):
+        node = compile(' and '.join('a%d' % i for i in range(10000)))
+        program = Program.from_node(node)
+        self.assertEqual(program.to_node(), node)
+        table = SymbolTable()
+        test = program.mask_function(table)
+        self.assertFalse(test(table.mask({'a0'})))
+        self.assertTrue(test(table.mask({'a%d' % i for i in range(10000)})))
+
+        node = Id('a')
+        for i in range(10000):
+            node = Not(node)
+
+        self.assertEqual(Program.from_node(node).to_node(), node)
+
+
+class TestNodes(TestCase):
+    def test_hash(self):
+        self.assertEqual(hash(compile('a and not b')), hash(And(Id('a'), Not(Id('b')))))
+        self.assertEqual(len({compile('a or b'), Or(Id('a'), Id('b')), compile('b or a')}), 2)
+
+    def test_slots(self):
+        for node in (Id('a'), Const(True), Not(Id('a')), And(Id('a'), Id('b')), Or(Id('a'), Id('b'))):
+            self.assertFalse(hasattr(node, '__dict__'))
+
+    def test_deep_equality(self):
+        a = Id('a')
+        b = Id('a')
+        for i in range(10000):
+            a = Not(a)
+            b = Not(b)
+
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, Not(b))
+
+    def test_deep_walks(self):
+        node = Id('a')
+        for i in range(10000):
+            node = And(Not(node), Id('b%d' % (i % 3)))
+
+        self.assertEqual(node.ids(), {'a', 'b0', 'b1', 'b2'})
+        # an even number of negations
+        self.assertTrue(node.eval({'a', 'b0', 'b1', 'b2'}))
+        self.assertFalse(node.eval({'b0', 'b1', 'b2'}))
+        self.assertFalse(node.eval({'a', 'b1', 'b2'}))
+        self.assertTrue(node.to_source(repr).startswith('((not ((not '))
@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+from ppdpy.symbols import SymbolTable
+
+
+class TestSymbolTable(TestCase):
+    def test_intern(self):
+        table = SymbolTable()
+        self.assertEqual(table.intern('a'), 1)
+        self.assertEqual(table.intern('b'), 2)
+        self.assertEqual(table.intern('a'), 1)
+        self.assertEqual(table.bit('b'), 2)
+        self.assertEqual(table.bit('c'), 0)
+        self.assertEqual(list(table), ['a', 'b'])
+        self.assertEqual(len(table), 2)
+        self.assertIn('a', table)
+        self.assertNotIn('c', table)
+
+    def test_mask(self):
+        table = SymbolTable(['a', 'b', 'c'])
+        self.assertEqual(table.mask(set()), 0)
+        self.assertEqual(table.mask({'a'}), 1)
+        self.assertEqual(table.mask({'a', 'c'}), 5)
+        self.assertEqual(table.mask(frozenset({'b', 'x', 'y', 'z'})), 2)
+        self.assertEqual(table.mask({'c': 1, 'x': 2}), 4)
+        self.assertEqual(table.mask(['a', 'b']), 3)
+        self.assertEqual(table.mask('ab'), 3)
+
+    def test_symbols(self):
+        table = SymbolTable(['a', 'b', 'c'])
+        self.assertEqual(table.symbols(0), set())
+        self.assertEqual(table.symbols(6), {'b', 'c'})
@@ -1,8 +1,13 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 
-from ppdpy import renders
-from ppdpy.exceptions import ExpressionSyntaxError, DirectiveSyntaxError
+from ppdpy import renders, compiles, preprocess, set_directive_prefix, Dialect
+from ppdpy.template_compiler import compile as compile_template, IfBlock
+from ppdpy.exceptions import PpdPyError, ExpressionSyntaxError, DirectiveSyntaxError
 from ppdpy.nodes import *
+from ppdpy.tests.samples import TEMPLATES, symbol_sets
 
 
 class TestTemplates(TestCase):
@@ -419,3 +424,310 @@ line 1
 """
         with self.assertRaises(DirectiveSyntaxError):
             self.assertEqual(renders(template, {'foo'}), '')
+
+
+class TestRenderCache(TestCase):
+    template = """
+#if x
+line 1
+#elif y and not z
+line 2
+#endif
+"""
+
+    def test_referenced(self):
+        self.assertEqual(compiles(self.template).referenced, {'x', 'y', 'z'})
+        self.assertEqual(compiles('foo').referenced, set())
+
+    def test_cache(self):
+        template = compiles(self.template, cache_size=2)
+        self.assertEqual(template.render({'x', 'a'}), '\nline 1\n')
+        self.assertEqual(template.render({'x', 'b'}), '\nline 1\n')
+        self.assertEqual(template.render({'y'}), '\nline 2\n')
+        self.assertEqual(template.render({'y', 'z'}), '\n')
+        self.assertEqual(template.render({'y', 'c'}), '\nline 2\n')
+        self.assertEqual(template.cache_info(), (2, 3, 2, 2))
+
+        # evicted by the two most recent variants
+        self.assertEqual(template.render({'x'}), '\nline 1\n')
+        self.assertEqual(template.cache_info().misses, 4)
+
+    def test_disabled(self):
+        template = compiles(self.template)
+        self.assertIsNone(template.cache_info())
+
+        template.enable_cache(8)
+        template.render({'x'})
+        self.assertEqual(template.cache_info().currsize, 1)
+
+        template.disable_cache()
+        self.assertIsNone(template.cache_info())
+
+
+class TestVariants(TestCase):
+    def test_same_as_render(self):
+        for text in TEMPLATES:
+            tree = compiles(text)
+            table = compiles(text, variants=True)
+            self.assertIsNotNone(table.variant_count())
+
+            for symbols in symbol_sets():
+                self.assertEqual(table.render(symbols), tree.render(symbols))
+
+    def test_distinct_outputs(self):
+        template = compiles('#if a or b\nfoo\n#endif\n#if c\nbar\n#endif', variants=True)
+        self.assertEqual(template.variant_count(), 4)
+
+    def test_symbol_cap(self):
+        template = compiles('#if a or b or c\nfoo\n#endif')
+        self.assertFalse(template.precompute_variants(max_symbols=2))
+        self.assertIsNone(template.variant_count())
+        self.assertEqual(template.render({'c'}), 'foo')
+
+    def test_memory_budget(self):
+        template = compiles('#if a\n' + 'x' * 10000 + '\n#endif')
+        self.assertFalse(template.precompute_variants(max_bytes=1000))
+        self.assertIsNone(template.variant_count())
+        self.assertTrue(template.precompute_variants())
+
+
+class TestRenderMany(TestCase):
+    def test_same_as_render(self):
+        for text in TEMPLATES:
+            template = compiles(text)
+            sets = list(symbol_sets())
+            self.assertEqual(template.render_many(sets), [template.render(s) for s in sets])
+
+    def test_shared_outputs(self):
+        template = compiles('#if a or b\nfoo\n#endif\nbar')
+        results = template.render_many([{'a'}, {'b'}, {'c'}, ['a', 'b'], {'b': True}])
+        self.assertEqual(results, ['foo\nbar', 'foo\nbar', 'bar', 'foo\nbar', 'foo\nbar'])
+        self.assertIs(results[0], results[1])
+        self.assertIs(results[0], results[3])
+
+    def test_empty(self):
+        self.assertEqual(compiles('foo').render_many([]), [])
+
+
+class TestStreaming(TestCase):
+    def test_same_as_render(self):
+        for text in TEMPLATES + ['\n', '\n\n', 'foo\n\n', '#if a\n#endif']:
+            for template in (compiles(text), compiles(text, variants=True)):
+                for symbols in symbol_sets(['a', 'b', 'c', 'select_unread_count', 'sort_descending']):
+                    expected = template.render(symbols)
+                    chunks = list(template.iter_render(symbols))
+                    self.assertEqual(''.join(chunks), expected)
+                    self.assertNotIn('', chunks)
+
+                    fp = io.StringIO()
+                    template.render_to(fp, symbols)
+                    self.assertEqual(fp.getvalue(), expected)
+
+    def test_chunks(self):
+        template = compiles('foo\n#if a\nbar\n#endif\nbaz\n')
+        self.assertEqual(list(template.iter_render({'a'})), ['foo\n', 'bar\n', 'baz\n'])
+        self.assertEqual(list(template.iter_render(set())), ['foo\n', 'baz\n'])
+
+
+class TestPreprocess(TestCase):
+    def preprocess(self, text, symbols):
+        out = io.StringIO()
+        preprocess(text.split('\n'), symbols, out)
+        return out.getvalue()
+
+    def test_same_as_render(self):
+        for text in TEMPLATES + ['\n', 'foo\n\n', '#if a\n#endif', '#if a\n#elif b\n#else\n#endif\n']:
+            for symbols in symbol_sets():
+                self.assertEqual(self.preprocess(text, symbols), renders(text, symbols))
+
+    def test_file_lines(self):
+        out = io.StringIO()
+        preprocess(io.StringIO('foo\r\n#if a\r\nbar\r\n#endif\r\nbaz\r\n'), {'a': 1}, out)
+        self.assertEqual(out.getvalue(), 'foo\nbar\nbaz')
+
+    def test_errors(self):
+        templates = [
+            '#if foo',
+            '#if\n#endif',
+            '#if foo and\n#endif',
+            '#if foo\n#else',
+            '#if foo\n#elif\n#endif',
+            '#if foo\n#else\n#elif bar\n#endif',
+            '#if foo\n#else\n#else\n#endif',
+            '#if foo\n#endif\n#endif',
+            '#else',
+            '#elif foo',
+            '#endif',
+            '#foo',
+            '#if foo\n    #if foo\n    #elif\n    #else\n#endif',
+        ]
+        for text in templates:
+            for symbols in ({'foo'}, set()):
+                with self.assertRaises(PpdPyError) as expected:
+                    renders(text, symbols)
+
+                with self.assertRaises(type(expected.exception)) as raised:
+                    self.preprocess(text, symbols)
+
+                self.assertEqual(raised.exception.message, expected.exception.message, text)
+
+
+class TestLargeTemplates(TestCase):
+    @staticmethod
+    def generate(lines):
+        # blocks of 20 lines: 13 lines of text and a conditional
+        chunk = ['insert into t values (%d);' % i for i in range(13)]
+        chunk += ['#if a and not b', 'x', '#elif c', 'y', '#else', 'z', '#endif']
+        return chunk * (lines // len(chunk))
+
+    @staticmethod
+    def time_compile(lines, repeat):
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            template = compile_template(lines)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        return template, best
+
+    def test_linear_compile(self):
+        small, small_time = self.time_compile(self.generate(100000), 3)
+        large, large_time = self.time_compile(self.generate(1000000), 1)
+
+        self.assertEqual(large.render({'a'}).count('\n'), 1000000 // 20 * 14 - 1)
+        self.assertEqual(large.render({'c'}), '\n'.join([small.render({'c'})] * 10))
+
+        # ten times the lines, so a quadratic compile would take about 100 times longer
+        self.assertLess(large_time, small_time * 30)
+
+    def test_shared_expressions(self):
+        first = compile_template(self.generate(100))
+        second = compile_template(self.generate(100))
+        entries = [block._if_entries[0] for block in first._blocks if isinstance(block, IfBlock)]
+        self.assertEqual(len({id(entry._expression) for entry in entries}), 1)
+        self.assertEqual(len({id(entry.test()) for entry in entries}), 1)
+
+        # nothing is shared between templates
+        other = next(block for block in second._blocks if isinstance(block, IfBlock))._if_entries[0]
+        self.assertIsNot(other._expression, entries[0]._expression)
+        self.assertIsNot(other.test(), entries[0].test())
+
+
+class TestDeepNesting(TestCase):
+    depth = 5000
+
+    @classmethod
+    def generate(cls):
+        lines = []
+        for i in range(cls.depth):
+            lines += ['open %d' % i, '#if s%d' % (i % 7)]
+
+        lines.append('inner')
+        for i in reversed(range(cls.depth)):
+            lines += ['#else', 'else %d' % i, '#endif', 'close %d' % i]
+
+        return '\n'.join(lines)
+
+    def test_render(self):
+        template = compiles(self.generate())
+        self.assertEqual(template.referenced, {'s%d' % i for i in range(7)})
+
+        all_symbols = {'s%d' % i for i in range(7)}
+        expected = '\n'.join(['open %d' % i for i in range(self.depth)] + ['inner'] + ['close %d' % i for i in reversed(range(self.depth))])
+        self.assertEqual(template.render(all_symbols), expected)
+        self.assertEqual(''.join(template.iter_render(all_symbols)), expected)
+        self.assertEqual(template.render_many([all_symbols, {'s1'}]), [expected, template.render({'s1'})])
+        self.assertEqual(template.render(set()), 'open 0\nelse 0\nclose 0')
+
+    def test_deep_expression(self):
+        # too deeply nested to be compiled as python source or walked recursively
+        text = '#if ' + 'not (' * (self.depth + 1) + 'a' + ')' * (self.depth + 1) + '\nx\n#endif'
+        mixed = '#if ' + 'a and (b or (' * self.depth + 'c' + '))' * self.depth + '\nx\n#endif'
+        self.assertEqual(renders(text, set()), 'x')
+        self.assertEqual(renders(text, {'a'}), '')
+
+        for mode in ('tree', 'codegen', 'bdd'):
+            for optimize in (False, True):
+                template = compiles(text, mode=mode, optimize=optimize)
+                self.assertEqual(template.referenced, {'a'})
+                self.assertEqual(template.render(set()), 'x')
+                self.assertEqual(template.render({'a'}), '')
+
+                template = compiles(mixed, mode=mode, optimize=optimize)
+                self.assertEqual(template.render({'a', 'c'}), 'x')
+                self.assertEqual(template.render({'a'}), '')
+                self.assertEqual(template.render({'b', 'c'}), '')
+
+        self.assertEqual(compiles(mixed).specialize(true={'a'}, false={'b'}).render({'c'}), 'x')
+        for symbols in [set(), {'a'}, {'a', 'c'}]:
+            out = io.StringIO()
+            preprocess(io.StringIO(text + '\n' + mixed), symbols, out)
+            self.assertEqual(out.getvalue(), renders(text + '\n' + mixed, symbols))
+
+    def test_unbalanced(self):
+        with self.assertRaises(DirectiveSyntaxError) as raised:
+            compiles('#if a\n' * self.depth + '#endif\n' * (self.depth - 1))
+
+        self.assertEqual(raised.exception.message, 'missing end directive')
+
+        with self.assertRaises(DirectiveSyntaxError) as raised:
+            compiles('#if a\n' * self.depth + '#endif\n' * (self.depth + 1))
+
+        self.assertEqual(raised.exception.message, 'unexpected directive #endif')
+
+
+class TestDialect(TestCase):
+    sql = '--#if a\nfoo\n--#else\n#bar\n--#endif'
+    c = '//#IF a\nfoo\n//#Else\n#bar\n//#endif'
+
+    def test_prefix(self):
+        template = compiles(self.sql, dialect=Dialect('--#'))
+        self.assertEqual(template.render({'a'}), 'foo')
+        self.assertEqual(template.render(set()), '#bar')
+
+        template = compiles(self.c, dialect=Dialect('//#'))
+        self.assertEqual(template.render(set()), '#bar')
+
+        out = io.StringIO()
+        preprocess(self.sql.split('\n'), {'a'}, out, Dialect('--#'))
+        self.assertEqual(out.getvalue(), 'foo')
+
+    def test_immutable(self):
+        dialect = Dialect('--#')
+        self.assertEqual(dialect.if_directive, '--#if')
+        self.assertEqual(dialect, Dialect('--#'))
+
+        with self.assertRaises(AttributeError):
+            dialect.prefix = '#'
+
+    def test_invalid(self):
+        for prefix in [None, 1, '# ', '\t#', '\u00a7']:
+            with self.assertRaises(ValueError):
+                Dialect(prefix)
+
+    def test_default(self):
+        try:
+            set_directive_prefix('--#')
+            self.assertEqual(compiles(self.sql).render(set()), '#bar')
+            # an explicit dialect does not depend on the default one
+            self.assertEqual(compiles('#if a\nfoo\n#endif', dialect=Dialect()).render(set()), '')
+
+        finally:
+            set_directive_prefix('#')
+
+        with self.assertRaises(ValueError):
+            set_directive_prefix('# ')
+
+    def test_concurrent(self):
+        dialects = [(Dialect('--#'), self.sql), (Dialect('//#'), self.c), (Dialect('%'), self.sql.replace('--#', '%'))]
+
+        def compile_and_render(i):
+            dialect, text = dialects[i % len(dialects)]
+            template = compiles(text, dialect=dialect)
+            return template.render({'a'}), template.render(set())
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(compile_and_render, range(300)))
+
+        self.assertEqual(set(results), {('foo', '#bar')})
@@ -1,38 +1,43 @@
 import unittest
-from ppdpy.utility import listview
-
-
-class TestListview(unittest.TestCase):
-    def test_walk(self):
-        tail = listview(range(100))
-        for i in range(100):
-            head, tail = tail.walk()
-            self.assertEqual(head, i)
-            self.assertEqual(len(tail), 99 - i)
-
-    def test_empty(self):
-        lv = listview([])
-        self.assertEqual(len(lv), 0)
-        val = True if lv else False
-        self.assertFalse(val)
-
-    def test_walk_to_empty(self):
-        lv = listview([1, 2, 3])
-        self.assertEqual(lv.h, 0)
-
-        head, tail = lv.walk()
-        self.assertEqual(tail.h, 1)
-        self.assertEqual(head, 1)
-        self.assertTrue(tail)
-
-        head, tail = tail.walk()
-        self.assertEqual(tail.h, 2)
-        self.assertEqual(head, 2)
-        self.assertTrue(tail)
-
-        head, tail = tail.walk()
-        self.assertEqual(head, 3)
-        self.assertFalse(tail)
-
-        with self.assertRaises(StopIteration):
-            tail.walk()
+from ppdpy.utility import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.put('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_info(self):
+        cache = LRUCache(4)
+        cache.get('a')
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('a')
+        self.assertEqual(cache.info(), (2, 1, 4, 1))
+
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, 4, 0))
+
+    def test_peek(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.peek('a'), 1)
+        self.assertIsNone(cache.peek('c'))
+        self.assertEqual(cache.info(), (0, 0, 2, 2))
+
+        # peeking does not refresh "a", so it is evicted first
+        cache.put('c', 3)
+        self.assertIsNone(cache.peek('a'))
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            LRUCache(0)
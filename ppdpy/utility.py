@@ -1,31 +1,64 @@
-class listview():
-    __slots__ = ['l', 'h', 'llen']
+from collections import OrderedDict, namedtuple
+from threading import Lock
 
-    def __init__(self, the_list, head_index=0, list_length=None):
-        self.l = the_list
-        self.h = head_index
 
-        self.llen = list_length if list_length is not None else len(the_list)
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
 
-    def walk(self):
-        if self.h >= self.llen:
-            raise StopIteration()
 
-        return self.head, self.tail
+class LRUCache():
+    """
+    A bounded mapping that evicts the least recently used entries, counting
+    hits and misses the same way `functools.lru_cache` does.
+    """
+    __slots__ = ['maxsize', 'hits', 'misses', '_data', '_lock']
 
-    @property
-    def head(self):
-        if self.h >= self.llen:
-            raise StopIteration()
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
 
-        return self.l[self.h]
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
 
-    @property
-    def tail(self):
-        if self.h >= self.llen:
-            raise StopIteration()
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
 
-        return listview(self.l, self.h+1, self.llen)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """
+        Returns the value of the key without counting a hit or miss, or
+        changing its recency.
+        """
+        with self._lock:
+            return self._data.get(key, default)
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
 
     def __len__(self):
-        return self.llen - self.h
+        return len(self._data)